@@ -0,0 +1,81 @@
+#################################################
+# A code for plotting layer by layer P_y        #
+# polarization of PbTiO3, 20 x 1 x 1 supercell. #
+# By Stephen Chege                              #
+# Date 22nd April 2025, 15:41                   #
+#################################################
+#
+# Compares the P_y profiles of several Bloch runs, one run directory each.
+# Pass glob patterns of run directories on the command line, e.g.
+#     python Bloch_minima_plot.py "*-Bloch*"
+# otherwise the four runs below are plotted.
+import sys
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from profile_loader import load_profiles
+
+## -------------------------------------------- LOAD DATA ------------------------------------- ##
+
+# Run directories, each with its PbTiO3.XV.P.dat
+run_patterns = sys.argv[1:] or ["Small-Bloch", "Large-Bloch", "Extra-large-Bloch", "Extra-large-Bloch-2"]
+
+# Load all the runs at once: (runs, layers, 4) array
+labels, profiles = load_profiles(run_patterns)
+
+## ------------------------------------------ EXTRACT COLUMNS ----------------------------------- ##
+# Extract columns polarization and position data
+X = profiles[:, :, 0] #Length of supercell along x-axis in Angstroms
+Py = profiles[:, :, 2] # Ising + Neel + Bloch
+
+# Create alternating labels for PbO and TiO2 layers (SIESTA)
+X_label = []
+
+for position in range(X.shape[1]):
+    if position % 2 == 0:
+        X_label.append("PbO")
+    else:
+        X_label.append("TiO$_2$")
+
+
+## -------------------------------------------- PLOT DATA ------------------------------------- ##
+# Plotting
+plt.rcParams["font.family"] = "Times New Roman" # Apply Times New Roman font
+
+# # Create a figure with specific size
+fig, ax = plt.subplots(1, 1, figsize=(8, 6), constrained_layout=True) # row, column, image size
+
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+#       SIESTA PLOT          %
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+# ----- SIESTA PLOT --------#
+# Colors of the first four runs as before, the default color cycle afterwards
+colors = ['k', 'c', 'm', 'orange']
+for run, label in enumerate(labels):
+    ax.plot(X[run], Py[run], '-', color=colors[run] if run < len(colors) else None, label=label)
+
+ax.legend(fontsize=12)
+
+# Set axis labels
+ax.set_ylabel("P$_y$", fontsize=16)
+
+# Alternating PbO and TiO2 labels on the x-axis
+ax.set_xticks(X[0]) # sets tick labels at the position(in Angstroms) of the PbO
+                           # or TiO2 layer.
+ax.set_xticklabels(X_label, rotation=90)
+
+# Change label size on ticks
+ax.tick_params(axis='both', labelsize=14)
+
+# set length of axis
+ax.set_xlim([X[-1, 0]-1, X[-1, -1]+1])
+ax.set_ylim([np.min(Py)-0.05, np.max(Py)+0.05])
+
+
+# save figure
+plt.savefig("MultipleBlochMinima_fully_relaxed_cell.png", dpi=300)
+
+# Show plot
+plt.show()
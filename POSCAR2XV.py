@@ -3,84 +3,191 @@
 # By Stephen Chege                              #
 # 30th, March, 2025, 09:53 am EAT               #
 #################################################
+import argparse
+import glob
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 
+from instrumentation import stage, timed
+from units import Ang2Bohr
+
 # File name
 file_name = "output_tolmxf_0.0025eVperA_HIST.poscar"    # Replace with POSCAR filename
                                                         # you wish to convert
 
-# Read the POSCAR file
-with open(file_name, 'r') as poscar_file:
-    lines = poscar_file.readlines()
-
-# Process the entire file line by line
-poscar_lines = []
-
-for line in lines:
-    values = line.split()
-
-    try:
-        # Convert numeric values to float where possible and
-        # keep string as it is
-        processed_line = [float(val) if val.replace('.', '', 1).replace('e-', '', 1).isdigit()
-                          else val for val in values] 
-        # .replace('.', '', 1).replace('e-', '', 1) removes the decimal point & scientific notation
-        # .isdigit() checks if the cleaned-up value is a number.
-
-    except ValueError:
-        processed_line = values
-
-    # append values so that poscar_lines has each line from the poscar file
-    poscar_lines.append(processed_line)
-
-# Convert `poscar_lines` to a numpy array (dtype=object to handle mixed types)
-poscar_numpy_array = np.array(poscar_lines, dtype=object)
+# A SIESTA _HIST.poscar holds one POSCAR block per relaxation step. Set
+# write_all_frames = True to get one XV file per step (PbTiO3_0001.XV, ...),
+# otherwise only the last (relaxed) frame is written to PbTiO3.XV
+write_all_frames = False
+
+# Number of frames converted together when writing all the frames of a
+# history, bounding the memory used to a batch of frames
+frames_per_batch = 64
+
+
+def read_poscar_frames(file_name):
+    """
+    Generator over the frames of a POSCAR or _HIST.poscar file.
+
+    The file is read line by line, so only one frame is held in memory
+    at a time, however long the relaxation history is.
+
+    Parameters:
+    file_name : POSCAR or _HIST.poscar file
+
+    Yields:
+    dictionary with the scaling factor, lattice vectors (3 x 3, Ang, not
+    yet scaled), species names, species counts and fractional coordinates
+    (N x 3) of one frame
+    """
+    with open(file_name, 'r') as poscar_file:
+        while True:
+            with stage("parse"):
+                # The 8 header lines: comment, scaling factor, 3 lattice
+                # vectors, species names, species counts, Direct/Cartesian
+                # The comment line may be blank, so the end of the file is
+                # only the empty string returned by readline. After a blank
+                # comment line the following blank lines are skipped: if
+                # nothing but whitespace is left, they were trailing blank
+                # lines, otherwise the next line is the scaling factor
+                comment_line = poscar_file.readline()
+                if comment_line == "":
+                    return  # end of file
+                scaling_line = poscar_file.readline()
+                if not comment_line.strip():
+                    while scaling_line.strip() == "" and scaling_line != "":
+                        scaling_line = poscar_file.readline()
+                    if scaling_line == "":
+                        return  # trailing blank lines
+                header = ([comment_line.split(), scaling_line.split()]
+                          + [poscar_file.readline().split() for _ in range(6)])
+
+                # Get scaling factor
+                scaling_factor = float(header[1][0])
+
+                # Get lattice vectors
+                lattice_vectors = np.array(header[2:5], dtype=float)
+
+                # Species names and number of atoms of each species
+                species_names = header[5]
+                atom_species_count = [int(count) for count in header[6]]
+                total_number_of_atoms = sum(atom_species_count)
+
+                # Coordinates of atoms: the whole block is converted in one go
+                # into a contiguous float64 (N, 3) array. Extra columns
+                # (selective dynamics flags, labels) are ignored.
+                coordinate_lines = list(itertools.islice(poscar_file, total_number_of_atoms))
+                if len(coordinate_lines) != total_number_of_atoms:
+                    raise ValueError(f"{file_name}: expected {total_number_of_atoms} coordinate lines, "
+                                     f"got {len(coordinate_lines)}")
+
+                fractional_atomic_coordinates_array = np.loadtxt(coordinate_lines, dtype=float,
+                                                                 usecols=(0, 1, 2), ndmin=2)
+
+            yield {"scaling_factor": scaling_factor,
+                   "lattice_vectors": lattice_vectors,
+                   "species_names": species_names,
+                   "species_counts": atom_species_count,
+                   "coordinates": fractional_atomic_coordinates_array}
+
+
+def last_poscar_frame(file_name):
+    """
+    Return the last frame of a POSCAR or _HIST.poscar file, i.e. the
+    relaxed structure, keeping only one frame in memory.
+    """
+    frame = None
+    for frame in read_poscar_frames(file_name):
+        pass
+
+    if frame is None:
+        raise ValueError(f"No POSCAR frame found in {file_name}")
+
+    return frame
+
+
+@timed("convert")
+def fractional_to_Bohr(fractional_coordinates, lattice_vectors, scaling_factor=1.0):
+    """
+    Convert fractional coordinates to Cartesian coordinates in Bohr.
+
+    Works for general (triclinic) cells: the lattice vectors are the rows
+    of lattice_vectors, so the Cartesian positions are frac @ lattice. The
+    POSCAR scaling factor and the Ang -> Bohr conversion are folded into
+    the lattice matrix, so the conversion is one matrix product.
+
+    Either a single frame or a batch of frames can be given; the batch is
+    converted in one batched matrix product.
+
+    Parameters:
+    fractional_coordinates : (N, 3) or (F, N, 3) fractional coordinates
+    lattice_vectors        : (3, 3) or (F, 3, 3) lattice vectors in Ang
+    scaling_factor         : POSCAR scaling factor, scalar or (F,)
+
+    Returns:
+    lattice_vectors_in_Bohr (3, 3) or (F, 3, 3),
+    coordinates in Bohr (N, 3) or (F, N, 3)
+    """
+    scaling_factor = np.asarray(scaling_factor, dtype=float)[..., None, None]
+    lattice_vectors_in_Bohr = np.asarray(lattice_vectors, dtype=float) * (scaling_factor * Ang2Bohr)
+
+    coords_in_Bohr = np.asarray(fractional_coordinates, dtype=float)[..., 0:3] @ lattice_vectors_in_Bohr
+
+    return lattice_vectors_in_Bohr, coords_in_Bohr
+
+
+def convert_frame(frame):
+    """
+    Convert the lattice vectors and fractional coordinates of a frame
+    to Bohr.
+
+    Returns:
+    lattice_vectors_in_Bohr (3 x 3), atomic coordinates in Bohr (N x 3)
+    """
+    return fractional_to_Bohr(frame["coordinates"], frame["lattice_vectors"], frame["scaling_factor"])
+
+
+# Chemical symbols in order of atomic number, for the atomic numbers of
+# the species named in the POSCAR header
+chemical_symbols = """H He Li Be B C N O F Ne Na Mg Al Si P S Cl Ar K Ca Sc Ti V Cr Mn Fe Co Ni
+Cu Zn Ga Ge As Se Br Kr Rb Sr Y Zr Nb Mo Tc Ru Rh Pd Ag Cd In Sn Sb Te I Xe Cs Ba La Ce Pr Nd
+Pm Sm Eu Gd Tb Dy Ho Er Tm Yb Lu Hf Ta W Re Os Ir Pt Au Hg Tl Pb Bi Po At Rn Fr Ra Ac Th Pa U
+Np Pu Am Cm Bk Cf Es Fm Md No Lr""".split()
+atomic_number_of = {symbol: number for number, symbol in enumerate(chemical_symbols, start=1)}
 
-# Get scaling factor from poscar_numpy_array
-scaling_factor = poscar_numpy_array[1]
-# print(scaling_factor) # For debugging
 
-# Get lattice vectors from poscar_numpy_array
-lattice_vectors = poscar_numpy_array[2:5]
-# print(lattice_vectors) #For debugging
+def species_arrays(species_names, species_counts):
+    """
+    Species index and atomic number of every atom, from the species names
+    and counts on lines 6 and 7 of the POSCAR header.
 
-# Convert lattice_vectors to a numpy array of floats
-lattice_vectors_numeric = np.array(lattice_vectors.tolist(), dtype=float)
+    Species are numbered 1, 2, 3, ... in the order of the header, as in
+    the ChemicalSpeciesLabel block of the SIESTA input, and each one is
+    repeated as many times as it has atoms. Potential suffixes such as
+    "Pb_d" or "O_pbe" are ignored for the atomic number.
 
-# scaled_lattice_vectors
-scaled_lattice_vectors = lattice_vectors_numeric * scaling_factor
-# print(scaled_lattice_vectors) # For debugging
+    Returns:
+    atomic_species_nums (N,), atomic_numbers (N,)
+    """
+    if len(species_names) != len(species_counts):
+        raise ValueError(f"{len(species_names)} species names but {len(species_counts)} species counts")
 
-# Convert lattice vectors from Angstroms to Bohrs
-lattice_vectors_in_Bohr = scaled_lattice_vectors / 0.529177 
-# print(lattice_vectors_in_Bohr) # For debugging
+    atomic_number = []
+    for name in species_names:
+        symbol = name.split("_")[0].split("/")[0]
+        if symbol not in atomic_number_of:
+            raise ValueError(f"Unknown chemical species in POSCAR header: {name}")
+        atomic_number.append(atomic_number_of[symbol])
 
-# Number of atoms
-atom_species_count = np.array(poscar_numpy_array[6])
-total_number_of_atoms = atom_species_count.sum()
-# print(total_number_of_atoms) # For debugging
+    atomic_species_nums = np.repeat(np.arange(1, len(species_counts) + 1), species_counts)
+    atomic_numbers = np.repeat(atomic_number, species_counts)
 
-# Coordinates of atoms
-coordinates_of_atoms_poscar = poscar_numpy_array[8:]
-fractional_atomic_coordinates_array = np.array(coordinates_of_atoms_poscar.tolist(), dtype=float)
-# print(fractional_atomic_coordinates_array)
+    return atomic_species_nums, atomic_numbers
 
-# Place the fractional_atomic_coordinates in columns
-x_atom_coords, y_atom_coords, z_atom_coords = fractional_atomic_coordinates_array[:,0:3].T
-
-# Multiply the fractional_atomic_coordinates in the columns with their respective
-# lattice constants
-x_atom_coords_in_Ang = x_atom_coords * scaled_lattice_vectors[0][0]
-y_atom_coords_in_Ang = y_atom_coords * scaled_lattice_vectors[1][1]
-z_atom_coords_in_Ang = z_atom_coords * scaled_lattice_vectors[2][2]
-
-# convert the x_atom_coords_in_Ang to Bohr
-x_atom_coords_in_Bohr = x_atom_coords_in_Ang / 0.529177
-y_atom_coords_in_Bohr = y_atom_coords_in_Ang / 0.529177
-z_atom_coords_in_Bohr = z_atom_coords_in_Ang / 0.529177
-
-# for coord in range(11):
-#     print(x_atom_coords_in_Bohr[coord], y_atom_coords_in_Bohr[coord], z_atom_coords_in_Bohr[coord])
 
 # Zeros for the XV file
 zeros = np.zeros((1,1))
@@ -96,38 +203,256 @@ eight_space = " " * 8
 zero_values = eight_space+f"{zero[0]:.9f}" + eight_space+f"{zero[0]:.9f}" + eight_space+f"{zero[0]:.9f}"
 
 
-def write_to_XV(output_file):
-    with open(output_file, 'w') as xv_file:
-#         # write lattice vectors
-        for vector in lattice_vectors_in_Bohr:
-            lattice_vector_Bohr = eight_space+f"{vector[0]:.9f}" + eight_space+f"{vector[1]:.9f}" + eight_space+f"{vector[2]:.9f}" + eight_space
-            xv_file.write(lattice_vector_Bohr+zero_values+"\n")
-        
-        # Write total number of atoms
-        xv_file.write(eight_space+f"{total_number_of_atoms}"+"\n")
+# Format of one atom line of the XV file:
+# species index, atomic number, x, y, z (Bohr) and the three zero velocities
+atom_line_format = two_space+"%d"+four_space + "%d"+four_space + \
+                   "%.9f"+four_space + "%.9f"+four_space + "%.9f"+four_space + zero_values + "\n"
 
-        # Write atomic species index
-        """ Change the line(s) below according to the file you are converting"""
-        atomic_species_numbers = [1, 2, 3, 3, 3]
-        atomic_species_nums = atomic_species_numbers * 20 # Multiply by 20 since we have 20 unit cells
 
-        # Atomic numbers
-        atomic_number = [82, 22, 8, 8, 8]
-        atomic_numbers = atomic_number * 20
+def format_xv_atoms(atomic_species_nums, atomic_numbers, coords_in_Bohr):
+    """
+    Format all the atom lines of the XV file in a single string.
 
-        # Write atomic coordinates in Bohr
-        for coord in range(len(x_atom_coords_in_Bohr)):
-            coords_atom_Bohr = f"{x_atom_coords_in_Bohr[coord]:.9f}"+four_space + \
-                               f"{y_atom_coords_in_Bohr[coord]:.9f}"+four_space + \
-                               f"{z_atom_coords_in_Bohr[coord]:.9f}"+four_space 
-            
-            atom_species = two_space+f"{atomic_species_nums[coord]}"+four_space
+    The (N, 5) block of species index, atomic number and coordinates is
+    formatted in one %-operation on a format string repeated N times,
+    instead of one f-string per atom.
 
-            atom_number = f"{atomic_numbers[coord]}" + four_space
-            # xv_file.write(coords_atom_Bohr + zero_values+ "\n")
-            xv_file.write(atom_species + atom_number + coords_atom_Bohr + zero_values+ "\n")
+    Parameters:
+    atomic_species_nums : species index of each atom (N,)
+    atomic_numbers      : atomic number of each atom (N,)
+    coords_in_Bohr      : atomic coordinates in Bohr (N, 3)
 
+    Returns:
+    the atom lines of the XV file
+    """
+    records = np.column_stack([atomic_species_nums, atomic_numbers, coords_in_Bohr])
+    return (atom_line_format * len(records)) % tuple(records.ravel().tolist())
 
-write_to_XV("PbTiO3.XV")
 
+@timed("write")
+def write_xv_file(output_file, lattice_vectors_in_Bohr, coords_in_Bohr, atomic_species_nums, atomic_numbers):
+    """
+    Write an XV file from lattice vectors and coordinates already in Bohr.
+    """
+    # write lattice vectors
+    xv_text = ""
+    for vector in lattice_vectors_in_Bohr:
+        lattice_vector_Bohr = eight_space+f"{vector[0]:.9f}" + eight_space+f"{vector[1]:.9f}" + eight_space+f"{vector[2]:.9f}" + eight_space
+        xv_text += lattice_vector_Bohr+zero_values+"\n"
 
+    # Write total number of atoms
+    xv_text += eight_space+f"{len(coords_in_Bohr)}"+"\n"
+
+    # Write atomic coordinates in Bohr
+    xv_text += format_xv_atoms(atomic_species_nums, atomic_numbers, coords_in_Bohr)
+
+    # The whole file goes to disk in one write
+    with open(output_file, 'w') as xv_file:
+        xv_file.write(xv_text)
+
+
+def write_to_XV(output_file, frame, species=None):
+    """
+    Write one frame to an XV file.
+
+    species is the (atomic_species_nums, atomic_numbers) pair returned by
+    species_arrays; it is worked out from the frame header if not given.
+    """
+    lattice_vectors_in_Bohr, coords_in_Bohr = convert_frame(frame)
+
+    # Atomic species index and atomic numbers, from the POSCAR header
+    if species is None:
+        species = species_arrays(frame["species_names"], frame["species_counts"])
+
+    write_xv_file(output_file, lattice_vectors_in_Bohr, coords_in_Bohr, *species)
+
+
+def write_frame_batch(output_files, frames, species):
+    """
+    Convert a batch of frames to Bohr at once and write one XV file per frame.
+    """
+    lattice_vectors_in_Bohr, coords_in_Bohr = fractional_to_Bohr(
+        np.stack([frame["coordinates"] for frame in frames]),
+        np.stack([frame["lattice_vectors"] for frame in frames]),
+        [frame["scaling_factor"] for frame in frames])
+
+    for output_file, lattice, coords in zip(output_files, lattice_vectors_in_Bohr, coords_in_Bohr):
+        write_xv_file(output_file, lattice, coords, *species)
+
+
+@timed("parse")
+def read_XV(file_name):
+    """
+    Read an XV file, as written by write_to_XV or by SIESTA.
+
+    Returns:
+    dictionary with the lattice vectors (3 x 3, Bohr), the species index
+    and atomic number of every atom (N,), the coordinates (N x 3, Bohr)
+    and the velocities (N x 3, Bohr/fs)
+    """
+    with open(file_name, 'r') as xv_file:
+        lattice_lines = [xv_file.readline() for _ in range(3)]
+        total_number_of_atoms = int(float(xv_file.readline()))
+        atom_lines = list(itertools.islice(xv_file, total_number_of_atoms))
+
+    lattice_vectors_in_Bohr = np.loadtxt(lattice_lines, usecols=(0, 1, 2), ndmin=2)
+    atoms = np.loadtxt(atom_lines, ndmin=2)
+    if len(atoms) != total_number_of_atoms:
+        raise ValueError(f"{file_name}: expected {total_number_of_atoms} atoms, got {len(atoms)}")
+
+    return {"lattice_vectors": lattice_vectors_in_Bohr,
+            "species": atoms[:, 0].astype(int),
+            "atomic_numbers": atoms[:, 1].astype(int),
+            "coordinates": atoms[:, 2:5],
+            "velocities": atoms[:, 5:8]}
+
+
+def convert_poscar(file_name, output_file="PbTiO3.XV", write_all_frames=False):
+    """
+    Convert a POSCAR or _HIST.poscar file to XV.
+
+    With write_all_frames = False only the last frame is written to
+    output_file. Otherwise every frame is written to its own file,
+    numbered from 1, e.g. PbTiO3_0001.XV, PbTiO3_0002.XV, ...
+
+    Returns:
+    number of XV files written
+    """
+    if not write_all_frames:
+        # Imported here since structure_cache reads POSCAR files through this module
+        from structure_cache import load_poscar_frame
+
+        write_to_XV(output_file, load_poscar_frame(file_name))
+        return 1
+
+    stem, dot, extension = output_file.rpartition(".")
+    number_of_frames = 0
+    species = None
+    batch_files, batch_frames = [], []
+    for number_of_frames, frame in enumerate(read_poscar_frames(file_name), start=1):
+        # The species do not change along a relaxation, so they are
+        # worked out once from the first frame
+        if species is None:
+            species = species_arrays(frame["species_names"], frame["species_counts"])
+
+        batch_files.append(f"{stem}_{number_of_frames:04d}{dot}{extension}")
+        batch_frames.append(frame)
+        if len(batch_frames) == frames_per_batch:
+            write_frame_batch(batch_files, batch_frames, species)
+            batch_files, batch_frames = [], []
+
+    if batch_frames:
+        write_frame_batch(batch_files, batch_frames, species)
+
+    return number_of_frames
+
+
+def xv_output_file(poscar_file, output_name="PbTiO3.XV", write_all_frames=False):
+    """
+    XV file written for poscar_file: output_name in the same directory as
+    the POSCAR file. With write_all_frames this is the file of the first
+    frame, e.g. PbTiO3_0001.XV.
+    """
+    output_file = os.path.join(os.path.dirname(poscar_file), output_name)
+    if write_all_frames:
+        stem, dot, extension = output_file.rpartition(".")
+        output_file = f"{stem}_0001{dot}{extension}"
+    return output_file
+
+
+def xv_is_up_to_date(poscar_file, output_file):
+    """
+    True if output_file exists and is newer than poscar_file.
+    """
+    return os.path.exists(output_file) and os.path.getmtime(output_file) > os.path.getmtime(poscar_file)
+
+
+def _convert_one(poscar_file, output_name, write_all_frames):
+    """
+    Worker of convert_many: convert one POSCAR file, return the number of
+    frames written and the number of atoms per frame.
+    """
+    output_file = os.path.join(os.path.dirname(poscar_file), output_name)
+    number_of_frames = convert_poscar(poscar_file, output_file, write_all_frames)
+    with open(poscar_file, 'r') as poscar_file_handle:
+        header = [poscar_file_handle.readline() for _ in range(7)]
+    number_of_atoms = sum(int(count) for count in header[6].split())
+    return number_of_frames, number_of_atoms
+
+
+@timed("convert_many")
+def convert_many(patterns, output_name="PbTiO3.XV", write_all_frames=False, processes=None, force=False):
+    """
+    Convert all the POSCAR files matching the glob patterns in a process pool.
+
+    Each XV file is written next to its POSCAR file, e.g. one PbTiO3.XV per
+    run directory. Files whose XV output is newer than the POSCAR are
+    skipped unless force is True.
+
+    Parameters:
+    patterns         : glob patterns or file names, e.g. ["runs/*/*_HIST.poscar"]
+    output_name      : name of the XV file written in each directory
+    write_all_frames : write one XV per frame instead of the last frame only
+    processes        : number of worker processes (default: number of CPUs)
+    force            : convert even if the XV output is up to date
+
+    Returns:
+    dictionary with the converted and skipped POSCAR files, and the number
+    of frames and atoms converted
+    """
+    poscar_files = sorted({poscar_file for pattern in patterns
+                           for poscar_file in (glob.glob(pattern) or [pattern])})
+    missing = [poscar_file for poscar_file in poscar_files if not os.path.isfile(poscar_file)]
+    if missing:
+        raise FileNotFoundError(f"No such POSCAR file(s): {', '.join(missing)}")
+
+    # Two POSCAR files in the same directory would overwrite each other's XV
+    output_files = [xv_output_file(poscar_file, output_name, write_all_frames) for poscar_file in poscar_files]
+    if len(set(output_files)) != len(output_files):
+        raise ValueError("Several POSCAR files would be written to the same XV file; "
+                         "keep one POSCAR per directory or change output_name")
+
+    to_convert = [poscar_file for poscar_file, output_file in zip(poscar_files, output_files)
+                  if force or not xv_is_up_to_date(poscar_file, output_file)]
+    skipped = [poscar_file for poscar_file in poscar_files if poscar_file not in to_convert]
+
+    number_of_frames = 0
+    number_of_atoms = 0
+    if to_convert:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            for frames, atoms in pool.map(_convert_one, to_convert,
+                                          [output_name] * len(to_convert),
+                                          [write_all_frames] * len(to_convert)):
+                number_of_frames += frames
+                number_of_atoms += frames * atoms
+
+    return {"converted": to_convert, "skipped": skipped,
+            "frames": number_of_frames, "atoms": number_of_atoms}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert POSCAR / _HIST.poscar files to SIESTA XV files.")
+    parser.add_argument("poscar_files", nargs="*",
+                        help="POSCAR files or glob patterns, e.g. 'runs/*/*_HIST.poscar' "
+                             "(default: file_name set in this script)")
+    parser.add_argument("-o", "--output-name", default="PbTiO3.XV",
+                        help="name of the XV file written next to each POSCAR (default: PbTiO3.XV)")
+    parser.add_argument("--all-frames", action="store_true", default=write_all_frames,
+                        help="write one XV file per frame instead of the last frame only")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="convert even if the XV file is newer than the POSCAR")
+    args = parser.parse_args()
+
+    if not args.poscar_files:
+        convert_poscar(file_name, args.output_name, args.all_frames)
+    else:
+        start = time.perf_counter()
+        summary = convert_many(args.poscar_files, args.output_name, args.all_frames, args.processes, args.force)
+        elapsed = time.perf_counter() - start
+
+        print(f"Converted {len(summary['converted'])} file(s), {summary['frames']} frame(s), "
+              f"{summary['atoms']} atoms in {elapsed:.2f} s "
+              f"({len(summary['converted']) / elapsed:.1f} files/s, {summary['atoms'] / elapsed:.0f} atoms/s)")
+        print(f"Skipped {len(summary['skipped'])} up-to-date file(s)")
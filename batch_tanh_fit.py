@@ -0,0 +1,254 @@
+#####################################################
+# Batched tanh fit of many DW polarization profiles #
+#                                                   #
+# Fits Pz(x) = Po * tanh((x - x0) / delta) to a     #
+# stack of M profiles at the same time with a       #
+# Levenberg-Marquardt solver: residuals, analytic   #
+# Jacobians and the 3 x 3 normal equations of all   #
+# the profiles are handled as (M, ...) arrays.      #
+#####################################################
+import warnings
+from statistics import NormalDist
+
+import numpy as np
+
+
+def tanh_model(x, params):
+    """
+    Po * tanh((x - x0) / delta) for every profile.
+
+    Parameters:
+    x      : positions (Å), (L,) shared by all profiles or (M, L)
+    params : (M, 3) array of Po, delta, x0
+
+    Returns:
+    (M, L) model values
+    """
+    Po, delta, x0 = (params[:, i, None] for i in range(3))
+    return Po * np.tanh((x - x0) / delta)
+
+
+def tanh_jacobian(x, params):
+    """
+    Analytic Jacobian of tanh_model with respect to Po, delta and x0.
+
+    Returns:
+    (M, L, 3) derivatives
+    """
+    Po, delta, x0 = (params[:, i, None] for i in range(3))
+    u = (x - x0) / delta
+    t = np.tanh(u)
+    sech2 = 1.0 - t * t
+    return np.stack([t,                        # d/dPo
+                     -Po * sech2 * u / delta,  # d/ddelta
+                     -Po * sech2 / delta],     # d/dx0
+                    axis=-1)
+
+
+def initial_guess(x, profiles):
+    """
+    The initial guess of dw_width.py for every profile: Po from max |Pz|,
+    delta ~ 5 Å and x0 at the middle layer.
+
+    Returns:
+    (M, 3) array of Po, delta, x0
+    """
+    profiles = np.atleast_2d(profiles)
+    x = np.broadcast_to(x, profiles.shape)
+    Po = np.max(np.abs(profiles), axis=1)
+    x0 = x[:, profiles.shape[1] // 2]
+    return np.column_stack([Po, np.full(len(profiles), 5.0), x0])
+
+
+def fit_tanh_batch(x, profiles, p0=None, max_iterations=200, ftol=1.e-12, xtol=1.e-12):
+    """
+    Fit Po * tanh((x - x0) / delta) to M profiles at once.
+
+    Parameters:
+    x              : positions (Å), (L,) shared by all profiles or (M, L)
+    profiles       : (M, L) polarization values, or (L,) for one profile
+    p0             : (M, 3) or (3,) initial Po, delta, x0 (default: initial_guess)
+    max_iterations : maximum number of Levenberg-Marquardt iterations
+    ftol, xtol     : relative tolerances on the sum of squares and on the
+                     parameters, as in scipy.optimize.curve_fit
+
+    Returns:
+    params      : (M, 3) fitted Po, delta, x0
+    covariances : (M, 3, 3) covariance of the parameters, scaled by the
+                  residual variance as curve_fit does by default
+    converged   : (M,) True for the fits that met ftol or xtol; False for
+                  those stopped by max_iterations or by a damping so large
+                  that no step lowers the cost, and for non-finite params
+    """
+    profiles = np.atleast_2d(np.asarray(profiles, dtype=float))
+    x = np.broadcast_to(np.asarray(x, dtype=float), profiles.shape)
+    number_of_profiles, number_of_points = profiles.shape
+
+    params = initial_guess(x, profiles) if p0 is None else \
+        np.array(np.broadcast_to(p0, (number_of_profiles, 3)), dtype=float)
+
+    residuals = profiles - tanh_model(x, params)
+    cost = np.einsum('ml,ml->m', residuals, residuals)
+    damping = np.full(number_of_profiles, 1.e-3)
+    active = np.ones(number_of_profiles, dtype=bool)
+    converged = np.zeros(number_of_profiles, dtype=bool)
+    identity = np.eye(3)
+
+    for _ in range(max_iterations):
+        if not active.any():
+            break
+        index = np.flatnonzero(active)
+        x_active, params_active = x[index], params[index]
+
+        # Normal equations of all the active profiles, (m, 3, 3) and (m, 3)
+        jacobian = tanh_jacobian(x_active, params_active)
+        JTJ = np.einsum('mli,mlj->mij', jacobian, jacobian)
+        JTr = np.einsum('mli,ml->mi', jacobian, residuals[index])
+
+        # Marquardt scaling of the damping by the diagonal of JTJ
+        diagonal = np.maximum(np.einsum('mii->mi', JTJ), 1.e-12)
+        step = np.linalg.solve(JTJ + damping[index, None, None] * diagonal[:, :, None] * identity,
+                               JTr[:, :, None])[:, :, 0]
+
+        # Do not let a single step shrink the width by more than half: from
+        # a wide initial guess a full step can jump into the flat region
+        # delta -> 0, where a DW narrower than one layer fits equally badly
+        shrink = np.abs(params_active[:, 1] + step[:, 1]) < 0.5 * np.abs(params_active[:, 1])
+        step[shrink] *= (0.5 * np.abs(params_active[shrink, 1] / step[shrink, 1]))[:, None]
+
+        new_params = params_active + step
+        new_residuals = profiles[index] - tanh_model(x_active, new_params)
+        new_cost = np.einsum('ml,ml->m', new_residuals, new_residuals)
+
+        # Accept the steps that lower the sum of squares and relax the
+        # damping there, increase it elsewhere
+        improved = np.isfinite(new_cost) & (new_cost <= cost[index])
+        accepted = index[improved]
+        small_cost_change = (cost[accepted] - new_cost[improved]) <= ftol * cost[accepted]
+        small_step = np.linalg.norm(step[improved], axis=1) <= \
+            xtol * (xtol + np.linalg.norm(params_active[improved], axis=1))
+
+        params[accepted] = new_params[improved]
+        residuals[accepted] = new_residuals[improved]
+        cost[accepted] = new_cost[improved]
+        damping[accepted] /= 10.0
+        damping[index[~improved]] *= 10.0
+
+        converged[accepted[small_cost_change | small_step]] = True
+        active[accepted[small_cost_change | small_step]] = False
+        # A damping this large means no step can lower the cost any more
+        active[damping > 1.e16] = False
+    else:
+        if active.any():
+            warnings.warn(f"{active.sum()} of {number_of_profiles} tanh fits did not converge "
+                          f"in {max_iterations} iterations")
+
+    # Covariance as in curve_fit: inverse of JTJ at the solution times the
+    # residual variance
+    jacobian = tanh_jacobian(x, params)
+    JTJ = np.einsum('mli,mlj->mij', jacobian, jacobian)
+    residual_variance = cost / max(number_of_points - 3, 1)
+    covariances = np.linalg.pinv(JTJ) * residual_variance[:, None, None]
+
+    converged &= np.isfinite(params).all(axis=1)
+    return params, covariances, converged
+
+
+def _summary(resampled_params, lower, upper, dropped):
+    # The robust spread is 1.4826 times the median absolute deviation, the
+    # standard deviation for normal samples but insensitive to the few
+    # resamples that miss the layers at the center of a narrow wall
+    median = np.median(resampled_params, axis=0)
+    return {"params": resampled_params,
+            "mean": resampled_params.mean(axis=0),
+            "std": resampled_params.std(axis=0, ddof=1),
+            "robust_std": 1.4826 * np.median(np.abs(resampled_params - median), axis=0),
+            "ci_low": lower,
+            "ci_high": upper,
+            "dropped": dropped}
+
+
+def bootstrap_tanh_fit(x, profile, p0=None, number_of_resamples=2000, confidence=0.95, seed=None):
+    """
+    Bootstrap uncertainty of the tanh fit of one DW profile.
+
+    The layers of the profile are resampled with replacement and all the
+    resampled profiles are fitted as one batch with fit_tanh_batch,
+    starting from p0 (or from the fit of the full profile).
+
+    Parameters:
+    x, profile          : (L,) positions (Å) and polarization values
+    p0                  : (3,) initial Po, delta, x0
+    number_of_resamples : number of bootstrap samples
+    confidence          : confidence level of the percentile intervals
+    seed                : seed of the random generator
+
+    Returns:
+    dictionary with the (B, 3) bootstrap parameters of the converged fits
+    ("params"), their "mean", "std" and "robust_std" (from the median
+    absolute deviation), the percentile confidence interval ("ci_low",
+    "ci_high") of Po, delta and x0, and the number of resamples "dropped"
+    because their fit did not converge
+    """
+    x = np.asarray(x, dtype=float)
+    profile = np.asarray(profile, dtype=float)
+    if p0 is None:
+        p0 = fit_tanh_batch(x, profile)[0][0]
+
+    rng = np.random.default_rng(seed)
+    samples = rng.integers(0, len(x), size=(number_of_resamples, len(x)))
+
+    with warnings.catch_warnings():
+        # A few resamples with many repeated layers may not converge; they
+        # are dropped below and counted in "dropped" instead
+        warnings.simplefilter("ignore")
+        resampled_params, _, converged = fit_tanh_batch(x[samples], profile[samples], p0=p0)
+
+    # Po and delta only enter as their product sign: Po * tanh(u / delta)
+    # is unchanged by flipping both, so report them with the sign of p0
+    flip = np.sign(resampled_params[:, 1]) != np.sign(p0[1])
+    resampled_params[flip, 0:2] *= -1
+    resampled_params = resampled_params[converged]
+    if len(resampled_params) < 2:
+        raise ValueError(f"Only {len(resampled_params)} of {number_of_resamples} bootstrap fits converged")
+
+    tail = 100 * (1 - confidence) / 2
+    lower, upper = np.percentile(resampled_params, [tail, 100 - tail], axis=0)
+    return _summary(resampled_params, lower, upper, number_of_resamples - len(resampled_params))
+
+
+def jackknife_tanh_fit(x, profile, p0=None, confidence=0.95):
+    """
+    Jackknife (leave-one-layer-out) uncertainty of the tanh fit of one
+    DW profile. The L leave-one-out profiles are fitted as one batch.
+
+    Returns:
+    dictionary as bootstrap_tanh_fit, with the jackknife standard error
+    in "std" and a normal confidence interval around the full fit; the
+    leave-one-out fits that did not converge are dropped
+    """
+    x = np.asarray(x, dtype=float)
+    profile = np.asarray(profile, dtype=float)
+    number_of_points = len(x)
+    full_params = fit_tanh_batch(x, profile, p0=p0)[0][0]
+
+    # Row i holds all the layers but layer i
+    keep = ~np.eye(number_of_points, dtype=bool)
+    left_out_x = np.broadcast_to(x, keep.shape)[keep].reshape(number_of_points, number_of_points - 1)
+    left_out_profiles = np.broadcast_to(profile, keep.shape)[keep].reshape(number_of_points, number_of_points - 1)
+
+    resampled_params, _, converged = fit_tanh_batch(left_out_x, left_out_profiles, p0=full_params)
+    resampled_params = resampled_params[converged]
+    number_of_fits = len(resampled_params)
+    if number_of_fits < 2:
+        raise ValueError(f"Only {number_of_fits} of {number_of_points} jackknife fits converged")
+
+    mean = resampled_params.mean(axis=0)
+    standard_error = np.sqrt((number_of_fits - 1) / number_of_fits
+                             * ((resampled_params - mean) ** 2).sum(axis=0))
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    summary = _summary(resampled_params, full_params - z * standard_error, full_params + z * standard_error,
+                       number_of_points - number_of_fits)
+    summary["std"] = standard_error
+    return summary
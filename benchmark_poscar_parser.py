@@ -0,0 +1,103 @@
+#####################################################
+# Benchmark of the POSCAR parser in POSCAR2XV.py    #
+# against the original per-token parser, for        #
+# synthetic PbTiO3 supercells of 100, 10k and 1M    #
+# atoms.                                            #
+#####################################################
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from POSCAR2XV import read_poscar_frames
+
+# Number of atoms in the synthetic supercells (5 atoms per PbTiO3 unit cell)
+NUMBER_OF_ATOMS = [100, 10_000, 1_000_000]
+
+
+def write_synthetic_poscar(file_name, number_of_atoms, seed=0):
+    """
+    Write an N x 1 x 1 PbTiO3 POSCAR with randomly displaced atoms.
+    """
+    number_uc = number_of_atoms // 5
+    rng = np.random.default_rng(seed)
+
+    # Fractional positions of Pb, Ti, O1, O2, O3 in one unit cell
+    basis = np.array([[0.0, 0.0, 0.0], [0.5, 0.5, 0.5],
+                      [0.5, 0.5, 0.0], [0.5, 0.0, 0.5], [0.0, 0.5, 0.5]])
+    cells = np.arange(number_uc)[:, None]
+    coordinates = np.concatenate([np.c_[(cells + b[0]) / number_uc,
+                                        np.full((number_uc, 2), b[1:])] for b in basis])
+    coordinates += rng.normal(0.0, 1.e-3, coordinates.shape)
+
+    with open(file_name, 'w') as poscar_file:
+        poscar_file.write("PbTiO3\n   1.00000000000000\n")
+        poscar_file.write(f"  {3.9 * number_uc:.10f}  0.0000000000  0.0000000000\n")
+        poscar_file.write("  0.0000000000  3.8900000000  0.0000000000\n")
+        poscar_file.write("  0.0000000000  0.0000000000  4.1100000000\n")
+        poscar_file.write("   Pb   Ti   O\n")
+        poscar_file.write(f"   {number_uc}   {number_uc}   {3 * number_uc}\nDirect\n")
+        np.savetxt(poscar_file, coordinates, fmt="%.16f")
+
+
+def legacy_parse(file_name):
+    """
+    The original parser of POSCAR2XV.py: every token goes through
+    isdigit, the lines are packed into a dtype=object array and turned
+    back into floats with .tolist().
+    """
+    with open(file_name, 'r') as poscar_file:
+        lines = poscar_file.readlines()
+
+    poscar_lines = []
+    for line in lines:
+        values = line.split()
+        try:
+            processed_line = [float(val) if val.replace('.', '', 1).replace('e-', '', 1).isdigit()
+                              else val for val in values]
+        except ValueError:
+            processed_line = values
+        poscar_lines.append(processed_line)
+
+    poscar_numpy_array = np.empty(len(poscar_lines), dtype=object)
+    poscar_numpy_array[:] = poscar_lines
+
+    coordinates_of_atoms_poscar = poscar_numpy_array[8:]
+    return np.array(coordinates_of_atoms_poscar.tolist(), dtype=float)
+
+
+def vectorized_parse(file_name):
+    """
+    The current parser of POSCAR2XV.py.
+    """
+    return next(read_poscar_frames(file_name))["coordinates"]
+
+
+def best_time(function, file_name, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(file_name)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1:]] or NUMBER_OF_ATOMS
+
+    print(f"{'atoms':>10} {'legacy (s)':>12} {'vectorized (s)':>15} {'speed-up':>9}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for number_of_atoms in sizes:
+            file_name = os.path.join(tmp_dir, f"POSCAR_{number_of_atoms}")
+            write_synthetic_poscar(file_name, number_of_atoms)
+
+            repeat = 5 if number_of_atoms < 100_000 else 1
+            legacy_time, legacy_coordinates = best_time(legacy_parse, file_name, repeat)
+            new_time, new_coordinates = best_time(vectorized_parse, file_name, repeat)
+
+            # Both parsers must give the same coordinates
+            assert np.array_equal(legacy_coordinates, new_coordinates)
+
+            print(f"{number_of_atoms:>10} {legacy_time:>12.4f} {new_time:>15.4f} {legacy_time / new_time:>8.1f}x")
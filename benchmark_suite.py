@@ -0,0 +1,226 @@
+#####################################################
+# Benchmark suite of the DW analysis stages, on     #
+# synthetic N x 1 x 1 PbTiO3 supercells and         #
+# synthetic tanh / Bloch polarization profiles:     #
+#                                                   #
+#   parse     POSCAR parsing (POSCAR2XV.py)         #
+#   write_xv  XV writing (POSCAR2XV.py)             #
+#   loadtxt   np.loadtxt of the profile             #
+#   fit       curve_fit of the DW width (cold)      #
+#   energy    DW energies of a table of runs        #
+#   render    profile figure (Agg)                  #
+#                                                   #
+# The best time of every stage is stored in a JSON  #
+# file, to be compared between commits:             #
+#   python benchmark_suite.py -o before.json        #
+#   python benchmark_suite.py -o after.json \       #
+#       --compare before.json                       #
+#####################################################
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from benchmark_poscar_parser import write_synthetic_poscar
+
+# Unit cells of the N x 1 x 1 supercells
+NUMBER_UC = [20, 200, 2_000, 20_000]
+
+# Stages, in the order they are run
+STAGES = ["parse", "write_xv", "loadtxt", "fit", "energy", "render"]
+
+# Layer spacing of the synthetic profiles (Å, half a lattice constant)
+LAYER_SPACING = 1.95
+
+
+def synthetic_wall_profile(number_uc, wall="Bloch", seed=0):
+    """
+    Layer-by-layer polarization of an N x 1 x 1 supercell with a DW at
+    its center: a tanh Ising profile of Pz and, for a Bloch wall, a
+    sech bump of Py (and a smaller Neel one of Px) at the wall.
+
+    Returns:
+    (2 N, 4) array of layer position (Ang), Px, Py, Pz (C/m^2)
+    """
+    rng = np.random.default_rng(seed)
+    x = np.arange(2 * number_uc) * LAYER_SPACING
+    u = np.clip((x - x[number_uc]) / 1.5, -50.0, 50.0)  # no cosh overflow far from the wall
+    Pz = -0.75 * np.tanh(u)
+    Px = np.zeros_like(x)
+    Py = np.zeros_like(x)
+    if wall == "Bloch":
+        Px = 0.003 / np.cosh(u)
+        Py = 0.05 / np.cosh(u)
+    noise = rng.normal(0.0, 1.e-4, (len(x), 3))
+    return np.column_stack([x, Px, Py, Pz]) + np.c_[np.zeros(len(x)), noise]
+
+
+def write_synthetic_configurations(file_name, number_of_rows, seed=0):
+    """
+    Write a dw_configurations.csv-like table of number_of_rows runs, a
+    third of each wall type.
+    """
+    rng = np.random.default_rng(seed)
+    walls = ["Ising", "Ising+Neel", "Ising+Neel+Bloch"]
+    with open(file_name, 'w') as table_file:
+        table_file.write("substrate,wall,code,number_uc,energy_tetra,energy_supercell,lattice_b,lattice_c\n")
+        for row in range(number_of_rows):
+            table_file.write(f"substrate_{row // 3},{walls[row % 3]},SIESTA,20,-8668.729994,"
+                             f"{-173374.2 - rng.uniform(0.0, 0.03):.6f},"
+                             f"{3.89 + rng.uniform(-0.02, 0.02):.6f},{4.11 + rng.uniform(-0.05, 0.05):.6f}\n")
+
+
+def best_time(function, repeat):
+    """
+    Best wall time of repeat calls of function().
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_size(number_uc, work_dir, repeat=3, dpi=300, render_limit=2_000):
+    """
+    Time every stage on an N x 1 x 1 supercell.
+
+    Returns:
+    dictionary {stage: best time (s)}, None for the skipped stages
+    """
+    from POSCAR2XV import last_poscar_frame, write_to_XV
+    from dw_energy_table import dw_energies, read_configurations
+    from dw_width import WINDOW, tanh_fit, tanh_fit_jacobian
+    from scipy.optimize import curve_fit
+    from polarization_engine import write_polarization_file
+
+    poscar_file = os.path.join(work_dir, f"POSCAR_{number_uc}")
+    xv_file = os.path.join(work_dir, f"PbTiO3_{number_uc}.XV")
+    profile_file = os.path.join(work_dir, f"PbTiO3_{number_uc}.XV.P.dat")
+    table_file = os.path.join(work_dir, f"configurations_{number_uc}.csv")
+
+    write_synthetic_poscar(poscar_file, 5 * number_uc)
+    write_polarization_file(profile_file, synthetic_wall_profile(number_uc))
+    write_synthetic_configurations(table_file, number_uc)
+    frame = last_poscar_frame(poscar_file)
+
+    # The fit is timed on the window of dw_width.fit_dw_width, preloaded and
+    # always from the cold initial guess: neither the profile cache nor the
+    # warm start of earlier fits is part of the fit stage
+    profile = np.loadtxt(profile_file, comments="#")
+    center = len(profile) // 2
+    dw_region_x = profile[center - WINDOW:center + WINDOW, 0]
+    dw_region_Pz = profile[center - WINDOW:center + WINDOW, 3]
+    initial_guess = [max(abs(dw_region_Pz)), 5.0, profile[center, 0]]
+
+    timings = {}
+    timings["parse"] = best_time(lambda: last_poscar_frame(poscar_file), repeat)
+    timings["write_xv"] = best_time(lambda: write_to_XV(xv_file, frame), repeat)
+    timings["loadtxt"] = best_time(lambda: np.loadtxt(profile_file, comments="#"), repeat)
+    timings["fit"] = best_time(lambda: curve_fit(tanh_fit, dw_region_x, dw_region_Pz, p0=initial_guess,
+                                                 jac=tanh_fit_jacobian), repeat)
+    timings["energy"] = best_time(lambda: dw_energies(read_configurations(table_file)), repeat)
+
+    # One tick label per layer: very large supercells are not plotted
+    if number_uc <= render_limit:
+        from render_figures import profile_spec, render
+
+        output = os.path.join(work_dir, f"pol_profile_{number_uc}.png")
+        render(profile_spec(profile_file, output, dpi=dpi))     # figure set-up left out
+        timings["render"] = best_time(lambda: render(profile_spec(profile_file, output, dpi=dpi)), repeat)
+    else:
+        timings["render"] = None
+    return timings
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_suite(sizes=NUMBER_UC, repeat=3, dpi=300, render_limit=2_000):
+    """
+    Time every stage for every supercell size.
+
+    Returns:
+    dictionary of the environment (commit, Python, NumPy) and the
+    timings of every size, as stored in the JSON file
+    """
+    results = []
+    cache_dir = os.environ.get("DW_CACHE_DIR")
+    with tempfile.TemporaryDirectory() as work_dir:
+        # The caches of the synthetic files go to the temporary directory too
+        os.environ["DW_CACHE_DIR"] = os.path.join(work_dir, "cache")
+        try:
+            for number_uc in sizes:
+                timings = benchmark_size(number_uc, work_dir, repeat, dpi, render_limit)
+                results.append({"number_uc": number_uc, "number_of_atoms": 5 * number_uc, "stages": timings})
+                print(f"{number_uc:>8} " + " ".join(f"{'-' if timings[stage] is None else f'{timings[stage]:.4f}':>10}"
+                                                    for stage in STAGES), flush=True)
+        finally:
+            if cache_dir is None:
+                del os.environ["DW_CACHE_DIR"]
+            else:
+                os.environ["DW_CACHE_DIR"] = cache_dir
+
+    return {"commit": git_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "repeat": repeat,
+            "dpi": dpi,
+            "results": results}
+
+
+def compare(report, reference):
+    """
+    Print the ratio of every stage time to that of a reference report
+    (> 1: slower than the reference).
+    """
+    reference_stages = {result["number_uc"]: result["stages"] for result in reference["results"]}
+    print(f"\nRatio to {reference.get('commit') or 'reference'} (> 1: slower)")
+    print(f"{'N':>8} " + " ".join(f"{stage:>10}" for stage in STAGES))
+    for result in report["results"]:
+        old = reference_stages.get(result["number_uc"])
+        if old is None:
+            continue
+        ratios = []
+        for stage in STAGES:
+            new_time, old_time = result["stages"].get(stage), old.get(stage)
+            ratios.append(f"{new_time / old_time:>10.2f}" if new_time and old_time else f"{'-':>10}")
+        print(f"{result['number_uc']:>8} " + " ".join(ratios))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the DW analysis stages on synthetic supercells.")
+    parser.add_argument("sizes", nargs="*", type=int, default=NUMBER_UC,
+                        help=f"unit cells of the N x 1 x 1 supercells (default: {NUMBER_UC})")
+    parser.add_argument("-o", "--output", default="benchmark_results.json",
+                        help="JSON file for the results (default: benchmark_results.json)")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="calls per stage, the best is kept")
+    parser.add_argument("--dpi", type=int, default=300, help="resolution of the rendered figure")
+    parser.add_argument("--render-limit", type=int, default=2_000,
+                        help="largest supercell whose figure is rendered (default: 2000)")
+    parser.add_argument("--compare", default=None, help="JSON file of a previous run to compare with")
+    args = parser.parse_args()
+
+    print(f"{'N':>8} " + " ".join(f"{stage:>10}" for stage in STAGES) + "   (best of "
+          f"{args.repeat}, s)")
+    report = run_suite(args.sizes, args.repeat, args.dpi, args.render_limit)
+
+    with open(args.output, 'w') as results_file:
+        json.dump(report, results_file, indent=1)
+
+    if args.compare:
+        with open(args.compare, 'r') as reference_file:
+            compare(report, json.load(reference_file))
@@ -0,0 +1,63 @@
+#####################################################
+# Benchmark of the batched tanh fit of              #
+# batch_tanh_fit.py against M sequential            #
+# scipy.optimize.curve_fit calls, on synthetic      #
+# noisy DW profiles.                                #
+#####################################################
+import sys
+import time
+
+import numpy as np
+from scipy.optimize import curve_fit
+
+from batch_tanh_fit import fit_tanh_batch, initial_guess, tanh_model
+
+# Number of profiles fitted at once
+NUMBER_OF_PROFILES = [10, 100, 1000]
+
+# Layers of each profile: 2 * WINDOW layers around the DW, as in dw_width.py
+WINDOW = 10
+LAYER_SPACING = 1.95    # Å, half a lattice constant
+
+
+def synthetic_profiles(number_of_profiles, seed=0):
+    """
+    Noisy tanh profiles with random Po, delta and x0 around those of a
+    PbTiO3 180 degree DW.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.arange(2 * WINDOW) * LAYER_SPACING
+    true_params = np.column_stack([rng.uniform(0.6, 0.9, number_of_profiles),
+                                   rng.uniform(1.0, 3.0, number_of_profiles),
+                                   x[WINDOW] + rng.uniform(-1.0, 1.0, number_of_profiles)])
+    profiles = tanh_model(x, true_params) + rng.normal(0.0, 0.005, (number_of_profiles, len(x)))
+    return x, profiles
+
+
+def tanh_fit(x, Po, delta, x0):
+    return Po * np.tanh((x - x0) / delta)
+
+
+def sequential_fit(x, profiles):
+    p0 = initial_guess(x, profiles)
+    return np.array([curve_fit(tanh_fit, x, profile, p0=guess)[0] for profile, guess in zip(profiles, p0)])
+
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1:]] or NUMBER_OF_PROFILES
+
+    print(f"{'profiles':>9} {'curve_fit (s)':>14} {'batch (s)':>10} {'speed-up':>9} {'max |dparams|':>14}")
+    for number_of_profiles in sizes:
+        x, profiles = synthetic_profiles(number_of_profiles)
+
+        start = time.perf_counter()
+        sequential_params = sequential_fit(x, profiles)
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch_params, _, _ = fit_tanh_batch(x, profiles)
+        batch_time = time.perf_counter() - start
+
+        difference = np.max(np.abs(np.abs(batch_params) - np.abs(sequential_params)))
+        print(f"{number_of_profiles:>9} {sequential_time:>14.4f} {batch_time:>10.4f} "
+              f"{sequential_time / batch_time:>8.1f}x {difference:>14.2e}")
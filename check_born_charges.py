@@ -0,0 +1,58 @@
+#####################################################
+# Check of the Born charge tensors of               #
+# polarization_engine.born_charge_tensors: every O  #
+# of a cubic PbTiO3 supercell must get its parallel #
+# charge along its Ti-O bond, whether the origin of #
+# the cell is on Pb or on Ti.                       #
+#                                                   #
+# Usage:                                            #
+#   python check_born_charges.py                    #
+#####################################################
+import numpy as np
+
+from polarization_engine import PbTiO3_born_charges, born_charge_tensors
+
+# Fractional coordinates in the cubic unit cell with Pb at the origin, and
+# the axis of the Ti-O bond of each O
+unit_cell = {82: [[0.0, 0.0, 0.0]],
+             22: [[0.5, 0.5, 0.5]],
+             8: [[0.5, 0.5, 0.0], [0.5, 0.0, 0.5], [0.0, 0.5, 0.5]]}
+O_bond_axes = [2, 1, 0]
+
+
+def supercell(repetitions, origin_shift):
+    """
+    Atomic numbers, fractional coordinates and O bond axes of a cubic
+    PbTiO3 supercell, the origin shifted by origin_shift (unit-cell units).
+    """
+    atomic_numbers, coordinates, bond_axes = [], [], []
+    for cell in np.ndindex(*repetitions):
+        for atomic_number, positions in unit_cell.items():
+            for k, position in enumerate(positions):
+                atomic_numbers.append(atomic_number)
+                coordinates.append((np.array(cell) + position - origin_shift) / repetitions % 1.0)
+                bond_axes.append(O_bond_axes[k] if atomic_number == 8 else -1)
+    return np.array(atomic_numbers), np.array(coordinates), np.array(bond_axes)
+
+
+def check(repetitions, origin_shift):
+    atomic_numbers, coordinates, bond_axes = supercell(repetitions, origin_shift)
+    tensors = born_charge_tensors(atomic_numbers, coordinates, repetitions)
+
+    parallel, perpendicular = PbTiO3_born_charges[8]
+    oxygens = np.flatnonzero(atomic_numbers == 8)
+    expected = np.full((len(oxygens), 3), perpendicular)
+    expected[np.arange(len(oxygens)), bond_axes[oxygens]] = parallel
+    diagonals = tensors[oxygens][:, [0, 1, 2], [0, 1, 2]]
+    if not np.allclose(diagonals, expected):
+        raise AssertionError(f"Origin shift {origin_shift}: O Born charges {diagonals[:3].tolist()}, "
+                             f"expected {expected[:3].tolist()}")
+
+
+if __name__ == "__main__":
+    repetitions = np.array([4, 1, 1])
+    for origin_shift in ([0.0, 0.0, 0.0],       # Pb origin
+                         [0.5, 0.5, 0.5],       # Ti origin
+                         [0.13, 0.31, 0.27]):   # general origin
+        check(repetitions, np.array(origin_shift))
+    print("Born charge tensors: O parallel axes along the Ti-O bonds for all origins")
@@ -0,0 +1,49 @@
+#####################################################
+# Check of polarization_engine.layer_polarization:  #
+# a uniformly polarized bulk PbTiO3 supercell must  #
+# give the same polarization on every PbO and TiO2  #
+# layer, equal to the bulk polarization of one      #
+# unit cell.                                        #
+#                                                   #
+# Usage:                                            #
+#   python check_layer_polarization.py              #
+#####################################################
+import numpy as np
+
+from check_born_charges import supercell
+from polarization_engine import born_charge_tensors, layer_polarization, layers_per_cell
+from units import e_per_Ang2_to_C_per_m2
+
+# Cubic lattice parameter (Ang) and displacements along z (Ang) of the
+# uniformly polarized cells
+lattice_parameter = 3.97
+displacements_z = {82: 0.0, 22: 0.3, 8: -0.1}
+
+
+def check(repetitions, origin_shift):
+    atomic_numbers, fractional, _ = supercell(repetitions, origin_shift)
+    lattice_vectors = np.diag(repetitions * lattice_parameter)
+    reference_coordinates = fractional @ lattice_vectors
+    coordinates = reference_coordinates.copy()
+    for atomic_number, displacement in displacements_z.items():
+        coordinates[atomic_numbers == atomic_number, 2] += displacement
+
+    tensors = born_charge_tensors(atomic_numbers, fractional, repetitions)
+    polarization = layer_polarization(coordinates, reference_coordinates, lattice_vectors, tensors,
+                                      layers_per_cell * repetitions[0])
+
+    # Bulk polarization: dipole of the whole supercell over its volume
+    dipole = np.einsum('nij,nj->i', tensors, coordinates - reference_coordinates)
+    bulk = dipole / abs(np.linalg.det(lattice_vectors)) * e_per_Ang2_to_C_per_m2
+    if not np.allclose(polarization[:, 1:4], bulk, atol=1.e-10):
+        raise AssertionError(f"Origin shift {origin_shift}: layer Pz {polarization[:, 3].round(4).tolist()}, "
+                             f"expected {bulk[2]:.4f} on every layer")
+    return bulk[2]
+
+
+if __name__ == "__main__":
+    repetitions = np.array([4, 1, 1])
+    for origin_shift in ([0.0, 0.0, 0.0],       # Pb origin
+                         [0.5, 0.5, 0.5]):      # Ti origin
+        Pz = check(repetitions, np.array(origin_shift))
+    print(f"Layer polarization: flat profile Pz = {Pz:.4f} C/m^2 for a uniformly polarized supercell")
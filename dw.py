@@ -0,0 +1,158 @@
+#####################################################
+# One command-line entry point for the DW scripts:  #
+#                                                   #
+#   python dw.py convert  POSCAR -> SIESTA XV       #
+#   python dw.py energy   DW energies               #
+#   python dw.py width    tanh fit of the DW width  #
+#   python dw.py profile  layer-by-layer P from XV  #
+#   python dw.py plot     profile figures, headless #
+#####################################################
+#
+# Only argparse is imported at start-up. Each subcommand imports the
+# modules it needs when it runs, so "convert" and "energy" never load
+# matplotlib or scipy, which keeps job scripts calling them thousands of
+# times fast. See "python dw.py <command> -h" for the options, and
+# "python dw.py --profile <command> ..." for a per-stage timing report.
+import argparse
+import sys
+import time
+
+
+def convert_command(args):
+    from POSCAR2XV import convert_many
+
+    start = time.perf_counter()
+    summary = convert_many(args.poscar_files, args.output_name, args.all_frames, args.processes, args.force)
+    elapsed = time.perf_counter() - start
+    print(f"Converted {len(summary['converted'])} file(s), {summary['frames']} frame(s), "
+          f"{summary['atoms']} atoms in {elapsed:.2f} s")
+    print(f"Skipped {len(summary['skipped'])} up-to-date file(s)")
+
+
+def energy_command(args):
+    if args.energy_supercell is None:
+        from dw_energy_table import dw_energies, read_configurations, write_results
+
+        configurations = read_configurations(args.configurations)
+        write_results(args.output or sys.stdout, configurations, dw_energies(configurations))
+        return
+
+    # A single configuration, as in dw_energy.py
+    from dw_energy_table import dw_energies, single_configuration
+
+    if args.lattice_b is None or args.lattice_c is None:
+        sys.exit("dw.py energy: --energy-supercell needs -b/--lattice-b and -c/--lattice-c")
+    try:
+        configuration = single_configuration(args.energy_supercell, args.lattice_b, args.lattice_c,
+                                             args.code, args.number_uc, args.energy_tetra)
+    except ValueError as error:
+        sys.exit(f"dw.py energy: {error} (--energy-tetra)")
+
+    energies = dw_energies(configuration)
+    print(float(energies["dw_energy_eV_per_uc"][0]), " eV per unit cell")
+    print(float(energies["dw_energy_mJ_per_m2"][0]), "mJ/m^2")
+    print(float(energies["dw_energy_meV_per_square"][0]), "meV/$square$")
+
+
+def width_command(args):
+    from dw_width import fit_dw_width, print_dw_width
+
+    for polarization_file in args.polarization_files:
+        if len(args.polarization_files) > 1:
+            print(f"--- {polarization_file}")
+        print_dw_width(fit_dw_width(polarization_file, args.window, args.uncertainty, args.resamples))
+
+
+def profile_command(args):
+    from polarization_engine import write_profile
+
+    write_profile(args.xv_file, args.reference_file, args.output, args.born_charges)
+
+
+def plot_command(args):
+    from render_figures import render_many, run_profile_specs
+
+    specs = run_profile_specs(args.polarization_files, args.abinit, args.output_name, args.dpi)
+    outputs = render_many(specs, args.processes)
+    print(f"Rendered {len(outputs)} figure(s)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="dw.py", description="PbTiO3 domain wall tools.")
+    parser.add_argument("--profile", nargs="?", const="dw_profile.json", default=None, metavar="REPORT",
+                        help="time every stage and write a JSON report (default: dw_profile.json) "
+                             "and a folded-stacks file next to it; see instrumentation.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert", help="convert POSCAR / _HIST.poscar files to SIESTA XV files")
+    convert.add_argument("poscar_files", nargs="+", help="POSCAR files or glob patterns")
+    convert.add_argument("-o", "--output-name", default="PbTiO3.XV",
+                         help="name of the XV file written next to each POSCAR (default: PbTiO3.XV)")
+    convert.add_argument("--all-frames", action="store_true",
+                         help="write one XV file per frame instead of the last frame only")
+    convert.add_argument("-j", "--processes", type=int, default=None,
+                         help="number of worker processes (default: number of CPUs)")
+    convert.add_argument("-f", "--force", action="store_true",
+                         help="convert even if the XV file is newer than the POSCAR")
+    convert.set_defaults(run=convert_command)
+
+    energy = commands.add_parser("energy", help="DW energies of a table of configurations, or of one run")
+    energy.add_argument("configurations", nargs="?", default="dw_configurations.csv",
+                        help="CSV table of configurations (default: dw_configurations.csv)")
+    energy.add_argument("-o", "--output", default=None,
+                        help="CSV file for the results (default: print to the terminal)")
+    energy.add_argument("-E", "--energy-supercell", type=float, default=None,
+                        help="energy of one supercell (eV), instead of a table")
+    energy.add_argument("-b", "--lattice-b", type=float, default=None, help="lattice parameter b (Ang)")
+    energy.add_argument("-c", "--lattice-c", type=float, default=None, help="lattice parameter c (Ang)")
+    energy.add_argument("--number-uc", type=int, default=20, help="unit cells in the supercell (default: 20)")
+    energy.add_argument("--code", choices=["SIESTA", "ABINIT"], default="SIESTA",
+                        help="code of the bulk reference energy (default: SIESTA)")
+    energy.add_argument("--energy-tetra", type=float, default=None,
+                        help="energy of the bulk tetragonal unit cell (eV) (default: that of --code; "
+                             "required for ABINIT)")
+    energy.set_defaults(run=energy_command)
+
+    width = commands.add_parser("width", help="fit the DW width to polarization profiles")
+    width.add_argument("polarization_files", nargs="*", default=["PbTiO3.XV.P.dat"],
+                       help="layer-by-layer polarization files (default: PbTiO3.XV.P.dat)")
+    width.add_argument("-w", "--window", type=int, default=10,
+                       help="layers included on each side of the DW center (default: 10)")
+    width.add_argument("-u", "--uncertainty", choices=["covariance", "bootstrap", "jackknife"],
+                       default="covariance", help="error bars of the fitted parameters (default: covariance)")
+    width.add_argument("--resamples", type=int, default=2000, help="bootstrap samples (default: 2000)")
+    width.set_defaults(run=width_command)
+
+    profile = commands.add_parser("profile", help="layer-by-layer polarization from an XV file")
+    profile.add_argument("xv_file", help="structure (XV file)")
+    profile.add_argument("reference_file", help="centrosymmetric reference structure (XV file)")
+    profile.add_argument("-o", "--output", default=None, help="output file (default: <xv_file>.P.dat)")
+    profile.add_argument("--born-charges", default=None,
+                         help="text file with the 9 components of the Born charge tensor of every atom")
+    profile.set_defaults(run=profile_command)
+
+    plot = commands.add_parser("plot", help="render the polarization profile figure of many runs, headless")
+    plot.add_argument("polarization_files", nargs="+", help="PbTiO3.XV.P.dat files, one per run")
+    plot.add_argument("--abinit", default=None,
+                      help="name of the ABINIT profile in each run directory, e.g. results_pol_fullyrelaxed.dat")
+    plot.add_argument("-o", "--output-name", default="pol_profile.png",
+                      help="name of the PNG written in each run directory (default: pol_profile.png)")
+    plot.add_argument("--dpi", type=int, default=300)
+    plot.add_argument("-j", "--processes", type=int, default=None,
+                      help="number of worker processes (default: number of CPUs)")
+    plot.set_defaults(run=plot_command)
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    if args.profile:
+        import instrumentation
+        instrumentation.enable(args.profile)
+
+        # Prefixed, since stage names like "convert" are also inner stages
+        with instrumentation.stage(f"dw {args.command}"):
+            args.run(args)
+    else:
+        args.run(args)
@@ -5,6 +5,8 @@ supercell.
 8th January 2024 at 14:11 
 By Stephen Chege
 """
+from units import eV_per_uc_to_mJ_per_m2
+
 # Getting the energy of the supercell in eV
 # ----------------------
 # Fully relaxed
@@ -119,17 +121,11 @@ def dw_energy(energy_supercell, lattice_b, lattice_c):
     
     print(dw_energy_in_eV_uc, " eV per unit cell")
 
-    #Convert DW energy to mJ
-    eV2J = 1.6022e-19
-    dw_energy_in_mJ_uc = dw_energy_in_eV_uc * eV2J * 1.e3
-    
-    # print(dw_energy_in_mJ, "mJ")
-    
-    # Area of PbO plane lattice_b x lattice_c, b and c are in Ang
-    area_in_meters_squared = float(lattice_b) * float(lattice_c) * 1.e-20
-
-    energy_in_mJ_per_meter_squared = (dw_energy_in_mJ_uc / area_in_meters_squared)  
+    # Convert DW energy to mJ/m^2, over the area of the PbO plane
+    # lattice_b x lattice_c, b and c are in Ang
+    energy_in_mJ_per_meter_squared = eV_per_uc_to_mJ_per_m2(dw_energy_in_eV_uc, float(lattice_b), float(lattice_c))
 
     print(energy_in_mJ_per_meter_squared, "mJ/m^2")
 
-dw_energy(energy_supercell, lattice_b, lattice_c)
+if __name__ == "__main__":
+    dw_energy(energy_supercell, lattice_b, lattice_c)
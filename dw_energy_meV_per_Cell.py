@@ -5,6 +5,8 @@ supercell.
 2nd May 2024 at 12:56 
 By Stephen Chege
 """
+from units import eV_to_meV
+
 # Getting the energy of the supercell in eV
 # ----------------------
 # Fully relaxed
@@ -125,8 +127,9 @@ def dw_energy(energy_supercell_Ising, energy_supercell_Bloch):
     print(dw_energy_in_eV_uc, " eV per unit cell")
 
     #Convert DW energy to meV
-    dw_energy_in_meV_uc = dw_energy_in_eV_uc * 1000
+    dw_energy_in_meV_uc = eV_to_meV(dw_energy_in_eV_uc)
     
     print(dw_energy_in_meV_uc, "meV/cell")
 
-dw_energy(energy_supercell_Ising, energy_supercell_Bloch)
+if __name__ == "__main__":
+    dw_energy(energy_supercell_Ising, energy_supercell_Bloch)
@@ -0,0 +1,193 @@
+"""
+A code to compute the energy of the Domain Wall (DW) for a whole table
+of configurations at once, instead of toggling the commented-out
+energy_supercell / lattice_b / lattice_c triples of dw_energy.py,
+mJm2_and_meVsquare_dw_energy.py and dw_energy_meV_per_Cell.py.
+
+The configurations (one row per substrate x wall type x code) are read
+from a CSV file, see dw_configurations.csv, with the columns
+
+    substrate, wall, code, number_uc, energy_tetra,
+    energy_supercell, lattice_b, lattice_c
+
+(or an output_file column pointing to the SIESTA/ABINIT output, see
+output_parser.py), and every DW energy is computed for all rows in one
+NumPy pass: eV per unit cell, mJ/m^2, meV/square and the Ising - Bloch
+difference in meV/cell.
+
+Usage:
+    python dw_energy_table.py dw_configurations.csv -o dw_energies.csv
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from instrumentation import timed
+from output_parser import final_results
+# bulk_reference_energy is used when the table has no energy_tetra column
+from units import bulk_reference_energy, eV_per_uc_to_mJ_per_m2, eV_to_meV, mJ_per_m2_to_meV_per_square
+
+# Wall type the Ising - Bloch differences are taken from
+ISING = "Ising"
+
+# Columns of the configurations, as read by read_configurations
+configuration_dtype = [("substrate", "U64"), ("wall", "U32"), ("code", "U16"), ("number_uc", "i8"),
+                       ("energy_tetra", "f8"), ("energy_supercell", "f8"), ("lattice_b", "f8"),
+                       ("lattice_c", "f8")]
+
+# Columns of the results table
+result_columns = ["dw_energy_eV_per_uc", "dw_energy_mJ_per_m2",
+                  "dw_energy_meV_per_square", "ising_minus_bloch_meV_per_cell"]
+
+
+@timed("load")
+def read_configurations(file_name):
+    """
+    Read a CSV table of DW configurations into a structured array.
+
+    number_uc defaults to 20 and energy_tetra to the value of
+    units.energy_tetra_of_code for the code of the row (there is none for
+    ABINIT, whose rows need an energy_tetra column). Instead of typing
+    energy_supercell, lattice_b and lattice_c, a row can name the SIESTA
+    or ABINIT output of the run in an output_file column; the final
+    energy and relaxed cell are then read from it.
+    """
+    # Comment lines are dropped first, otherwise genfromtxt takes the
+    # first of them for the header
+    with open(file_name, 'r') as table_file:
+        lines = [line for line in table_file if line.strip() and not line.lstrip().startswith("#")]
+
+    table = np.genfromtxt(lines, delimiter=",", names=True, dtype=None,
+                          encoding="utf-8", autostrip=True)
+    table = np.atleast_1d(table)
+
+    required = {"substrate", "wall", "code"}
+    if "output_file" not in table.dtype.names:
+        required |= {"energy_supercell", "lattice_b", "lattice_c"}
+    missing = required - set(table.dtype.names)
+    if missing:
+        raise ValueError(f"{file_name}: missing column(s) {', '.join(sorted(missing))}")
+
+    columns = {name: table[name] for name in table.dtype.names}
+    if "output_file" in columns:
+        fill_from_outputs(columns, os.path.dirname(file_name))
+    if "number_uc" not in columns:
+        columns["number_uc"] = np.full(len(table), 20)
+    if "energy_tetra" not in columns:
+        columns["energy_tetra"] = np.array([bulk_reference_energy(code) for code in table["code"]])
+
+    configurations = np.empty(len(table), dtype=configuration_dtype)
+    for name in configurations.dtype.names:
+        configurations[name] = columns[name]
+
+    return configurations
+
+
+def single_configuration(energy_supercell, lattice_b, lattice_c, code="SIESTA", number_uc=20,
+                         energy_tetra=None, substrate="", wall=""):
+    """
+    One configuration as a one-row structured array for dw_energies, e.g.
+    for a single run of "dw.py energy" or of the pipeline. energy_tetra
+    defaults to that of code (see units.bulk_reference_energy).
+    """
+    configuration = np.empty(1, dtype=configuration_dtype)
+    configuration[0] = (substrate, wall, code, number_uc, bulk_reference_energy(code, energy_tetra),
+                        energy_supercell, lattice_b, lattice_c)
+    return configuration
+
+
+def fill_from_outputs(columns, directory=""):
+    """
+    Take energy_supercell, lattice_b and lattice_c from the SIESTA/ABINIT
+    output named in the output_file column, for the rows that have one.
+    Paths are relative to directory, the directory of the table.
+    """
+    number_of_rows = len(columns["output_file"])
+    for name in ["energy_supercell", "lattice_b", "lattice_c"]:
+        columns[name] = np.array(columns.get(name, np.full(number_of_rows, np.nan)), dtype=float)
+
+    for row, output_file in enumerate(columns["output_file"].tolist()):
+        if not output_file:
+            continue
+        results = final_results(os.path.join(directory, output_file), columns["code"][row])
+        columns["energy_supercell"][row] = results["energy_supercell"]
+        columns["lattice_b"][row] = results["cell_lengths"][1]
+        columns["lattice_c"][row] = results["cell_lengths"][2]
+
+
+@timed("energy")
+def dw_energies(configurations):
+    """
+    DW energies of all the configurations, computed in one vectorized pass.
+
+    Parameters:
+    configurations : structured array as returned by read_configurations
+
+    Returns:
+    dictionary of arrays, one value per configuration:
+    dw_energy_eV_per_uc            : DW energy in eV per unit cell, Eq. (1) of the paper
+    dw_energy_mJ_per_m2            : DW energy in mJ/m^2
+    dw_energy_meV_per_square       : DW energy in meV per square (PbO plane area)
+    ising_minus_bloch_meV_per_cell : E_DW(Ising) - E_DW(row) in meV/cell for the
+                                     same substrate and code (nan if there is no Ising row)
+    """
+    # Energy of DW in eV per unit cell, according to Eq. (1) of the paper
+    dw_energy_in_eV_uc = (configurations["energy_supercell"]
+                          - configurations["number_uc"] * configurations["energy_tetra"]) * 0.5
+
+    # Convert DW energy to mJ/m^2 over the PbO plane lattice_b x lattice_c (Ang)
+    lattice_b = configurations["lattice_b"]
+    lattice_c = configurations["lattice_c"]
+    energy_in_mJ_per_meter_squared = eV_per_uc_to_mJ_per_m2(dw_energy_in_eV_uc, lattice_b, lattice_c)
+
+    # From mJ/m^2 to meV/square, where square is the cell surface area of the DW
+    energy_in_meV_per_square = mJ_per_m2_to_meV_per_square(energy_in_mJ_per_meter_squared, lattice_b, lattice_c)
+
+    # Ising - Bloch difference within each (substrate, code) group: the Ising
+    # energy of every group is scattered back to all the rows of the group
+    groups = np.char.add(np.char.add(configurations["substrate"], "|"), configurations["code"])
+    _, group_index = np.unique(groups, return_inverse=True)
+    is_ising = configurations["wall"] == ISING
+
+    ising_energy = np.full(group_index.max() + 1 if len(group_index) else 0, np.nan)
+    ising_energy[group_index[is_ising]] = dw_energy_in_eV_uc[is_ising]
+    ising_minus_bloch_meV_per_cell = eV_to_meV(ising_energy[group_index] - dw_energy_in_eV_uc)
+
+    return {"dw_energy_eV_per_uc": dw_energy_in_eV_uc,
+            "dw_energy_mJ_per_m2": energy_in_mJ_per_meter_squared,
+            "dw_energy_meV_per_square": energy_in_meV_per_square,
+            "ising_minus_bloch_meV_per_cell": ising_minus_bloch_meV_per_cell}
+
+
+def write_results(output, configurations, energies):
+    """
+    Write the configurations and their DW energies as a CSV table to
+    output (file name or open file).
+    """
+    header = ",".join(list(configurations.dtype.names) + result_columns)
+    row_format = "%s,%s,%s,%d,%.6f,%.6f,%.6f,%.6f," + ",".join(["%.6f"] * len(result_columns)) + "\n"
+
+    rows = zip(*[configurations[name].tolist() for name in configurations.dtype.names],
+               *[energies[name].tolist() for name in result_columns])
+    text = header + "\n" + "".join(row_format % row for row in rows)
+
+    if hasattr(output, "write"):
+        output.write(text)
+    else:
+        with open(output, 'w') as output_file:
+            output_file.write(text)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DW energies for a table of configurations.")
+    parser.add_argument("configurations", nargs="?", default="dw_configurations.csv",
+                        help="CSV table of configurations (default: dw_configurations.csv)")
+    parser.add_argument("-o", "--output", default=None,
+                        help="CSV file for the results (default: print to the terminal)")
+    args = parser.parse_args()
+
+    configurations = read_configurations(args.configurations)
+    energies = dw_energies(configurations)
+    write_results(args.output or sys.stdout, configurations, energies)
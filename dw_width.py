@@ -5,25 +5,27 @@
 # By Stephen Chege                                  #
 # Date 1st April 2025, 14:26                        #
 #####################################################
+import hashlib
+import json
+import os
+import tempfile
+
 import numpy as np
-import matplotlib.pyplot as plt
 from scipy.optimize import curve_fit
 
-# Load the data, skipping the header
-polarization_data = np.loadtxt("PbTiO3.XV.P.dat", comments="#") # Replace with your polarization data
-
-x_in_Ang = polarization_data[:,0] # Layer positions
-Pz = polarization_data[:, 3] # Layer-by-layer Ising polarization values
-
-# Get domain wall center plane
-dw_center_index = int(len(x_in_Ang) / 2)
+from batch_tanh_fit import bootstrap_tanh_fit, jackknife_tanh_fit, tanh_jacobian
+from instrumentation import stage
+from structure_cache import cache_directory, load_polarization
 
-dw_center_x = x_in_Ang[dw_center_index]  # Position of DW center
+polarization_file = "PbTiO3.XV.P.dat" # Replace with your polarization data
 
 # Select a symmetric WINDOW around the domain wall
 WINDOW = 10 # change this based on layers you want to include away from the center of the DW.
-dw_region_x = x_in_Ang[dw_center_index - WINDOW : dw_center_index + WINDOW] # domain wall region
-dw_region_Pz = Pz[dw_center_index - WINDOW : dw_center_index + WINDOW] # Pz values
+
+# Error bars of the fitted parameters: "covariance" (from curve_fit),
+# "bootstrap" (resampling the WINDOW layers) or "jackknife" (leave one layer out)
+UNCERTAINTY = "covariance"
+NUMBER_OF_RESAMPLES = 2000 # bootstrap samples, all fitted as one batch
 
 #  Define the tanh fitting function
 def tanh_fit(x, Po, delta, x0):
@@ -42,17 +44,151 @@ def tanh_fit(x, Po, delta, x0):
     return Po * np.tanh((x - x0) / delta)
 
 
-# Initial parameter guesses (Po from max |Pz|, delta ~ 5 Å, x0 = dw_center_x)
-initial_guess = [max(abs(dw_region_Pz)), 5.0, dw_center_x] 
+def tanh_fit_jacobian(x, Po, delta, x0):
+    """
+    Closed-form Jacobian of tanh_fit with respect to Po, delta and x0,
+    so that curve_fit does not differentiate by finite differences.
+
+    Returns:
+    (len(x), 3) derivatives
+    """
+    return tanh_jacobian(x, np.array([[Po, delta, x0]]))[0]
+
+
+# ------ Warm start from previous fits ------ #
+# The fitted (Po, delta, x0) of every run are kept in the cache directory
+# (see structure_cache.py), one small JSON file per polarization file and
+# WINDOW, so a refit after a small relaxation update starts next to the
+# solution. With one file per run, parallel fits of different runs sharing
+# a DW_CACHE_DIR never write to the same file.
+def warm_start_key(data_file, window):
+    return f"{os.path.abspath(data_file)}|WINDOW={window}"
+
 
-# Perform the curve fitting
-params, _ = curve_fit(tanh_fit, dw_region_x, dw_region_Pz, p0=initial_guess)
+def warm_start_file(data_file, window):
+    key_hash = hashlib.sha256(warm_start_key(data_file, window).encode()).hexdigest()[:16]
+    return os.path.join(cache_directory(data_file), "tanh_fits", f"{key_hash}.json")
 
-# Extract the fitted domain wall width
-Po_fitted, delta_fitted, x0_fitted = params
+
+def load_warm_start(data_file, window):
+    """
+    Previously fitted (Po, delta, x0) for this run, or None.
+    """
+    try:
+        with open(warm_start_file(data_file, window), 'r') as fits_file:
+            fit = json.load(fits_file)
+    except (OSError, ValueError):
+        return None
+    # Guards against a hash collision between two runs
+    if fit.get("key") != warm_start_key(data_file, window):
+        return None
+    return fit.get("params")
+
+
+def save_warm_start(data_file, window, params):
+    """
+    Store the fitted (Po, delta, x0) of this run for the next fit.
+    """
+    fits_file_name = warm_start_file(data_file, window)
+    os.makedirs(os.path.dirname(fits_file_name), exist_ok=True)
+
+    # Written to a unique temporary file and moved in place, so a reader
+    # never sees a half-written file
+    handle, tmp_file_name = tempfile.mkstemp(dir=os.path.dirname(fits_file_name), suffix=".tmp")
+    try:
+        with os.fdopen(handle, 'w') as fits_file:
+            json.dump({"key": warm_start_key(data_file, window),
+                       "params": [float(value) for value in params]}, fits_file)
+        os.replace(tmp_file_name, fits_file_name)
+    except BaseException:
+        os.remove(tmp_file_name)
+        raise
+
+
+def fit_dw_width(polarization_file=polarization_file, window=WINDOW, uncertainty=UNCERTAINTY,
+                 number_of_resamples=NUMBER_OF_RESAMPLES):
+    """
+    Fit Pz = Po tanh((x - x0) / delta) to the layers of a polarization
+    profile within window layers of the DW center.
+
+    Parameters:
+    polarization_file   : layer-by-layer polarization (PbTiO3.XV.P.dat)
+    window              : layers included on each side of the DW center
+    uncertainty         : "covariance", "bootstrap" or "jackknife"
+    number_of_resamples : bootstrap samples
+
+    Returns:
+    dictionary with the fitted params (Po, delta, x0), their standard
+    errors params_error (covariance) or the resampling statistics
+    (bootstrap / jackknife), and the fitted dw_region_x, dw_region_Pz
+    """
+    # Load the data, skipping the header
+    polarization_data = load_polarization(polarization_file)
+
+    x_in_Ang = polarization_data[:,0] # Layer positions
+    Pz = polarization_data[:, 3] # Layer-by-layer Ising polarization values
+
+    # Get domain wall center plane
+    dw_center_index = int(len(x_in_Ang) / 2)
+
+    dw_center_x = x_in_Ang[dw_center_index]  # Position of DW center
+
+    dw_region_x = x_in_Ang[dw_center_index - window : dw_center_index + window] # domain wall region
+    dw_region_Pz = Pz[dw_center_index - window : dw_center_index + window] # Pz values
+
+    # Initial parameter guesses (Po from max |Pz|, delta ~ 5 Å, x0 = dw_center_x),
+    # unless this run was fitted before
+    initial_guess = load_warm_start(polarization_file, window) or [max(abs(dw_region_Pz)), 5.0, dw_center_x]
+
+    with stage("fit"):
+        # Perform the curve fitting
+        params, covariance = curve_fit(tanh_fit, dw_region_x, dw_region_Pz, p0=initial_guess, jac=tanh_fit_jacobian)
+        save_warm_start(polarization_file, window, params)
+
+        result = {"params": params, "uncertainty": uncertainty,
+                  "dw_region_x": dw_region_x, "dw_region_Pz": dw_region_Pz}
+
+        # Uncertainty of Po, delta and x0
+        if uncertainty == "bootstrap":
+            result["resampling"] = bootstrap_tanh_fit(dw_region_x, dw_region_Pz, params, number_of_resamples)
+        elif uncertainty == "jackknife":
+            result["resampling"] = jackknife_tanh_fit(dw_region_x, dw_region_Pz, params)
+        else:
+            result["resampling"] = None
+            result["params_error"] = np.sqrt(np.diag(covariance))
+    return result
+
+
+def print_dw_width(result):
+    """
+    Print the fitted DW width and polarization of fit_dw_width.
+    """
+    # Extract the fitted domain wall width
+    Po_fitted, delta_fitted, x0_fitted = result["params"]
+
+    # Print result
+    print(f"Estimated domain wall width: {delta_fitted:.2f} Ang")
+    print(f"Fitted polarization: {Po_fitted} C/m^2")
+    print(f"Layer by layer computed polarization: {np.max(result['dw_region_Pz'])} C/m^2")
+
+    # Print uncertainties
+    resampling = result["resampling"]
+    if resampling is None:
+        params_error = result["params_error"]
+        print(f"Standard errors (curve_fit covariance): Po = {params_error[0]:.2e} C/m^2, "
+              f"delta = {params_error[1]:.2e} Ang, x0 = {params_error[2]:.2e} Ang")
+    else:
+        for name, unit, i in [("Po", "C/m^2", 0), ("delta", "Ang", 1), ("x0", "Ang", 2)]:
+            print(f"{result['uncertainty']} 95% confidence interval of {name}: "
+                  f"[{resampling['ci_low'][i]:.4f}, {resampling['ci_high'][i]:.4f}] {unit} "
+                  f"(std {resampling['std'][i]:.2e}, robust std {resampling['robust_std'][i]:.2e})")
+        if resampling["dropped"]:
+            print(f"{resampling['dropped']} {result['uncertainty']} fit(s) did not converge and were left out")
 
 
 # --------- PLOTTING -------------------------#
+# import matplotlib.pyplot as plt
+
 # Create alternating labels for PbO and TiO2 layers
 # X_label = []
 
@@ -83,7 +219,5 @@ Po_fitted, delta_fitted, x0_fitted = params
 
 # plt.show()
 
-# Print result
-print(f"Estimated domain wall width: {delta_fitted:.2f} Ang")
-print(f"Fitted polarization: {Po_fitted} C/m^2")
-print(f"Layer by layer computed polarization: {np.max(dw_region_Pz)} C/m^2")
+if __name__ == "__main__":
+    print_dw_width(fit_dw_width(polarization_file, WINDOW, UNCERTAINTY, NUMBER_OF_RESAMPLES))
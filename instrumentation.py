@@ -0,0 +1,161 @@
+#####################################################
+# Opt-in timing and memory instrumentation of the   #
+# analysis stages (parse, convert, write, load,     #
+# fit, render, ...).                                #
+#                                                   #
+# Switched on by the DW_PROFILE environment         #
+# variable, or by "python dw.py --profile ...":     #
+#                                                   #
+#   DW_PROFILE=1 python POSCAR2XV.py                #
+#   DW_PROFILE=run.json python dw_width.py          #
+#                                                   #
+# Every stage records its wall time, CPU time and   #
+# peak tracemalloc memory. At exit a JSON report    #
+# (dw_profile.json unless DW_PROFILE names a file)  #
+# and a flame-graph "folded stacks" file next to it #
+# (dw_profile.folded, for flamegraph.pl or          #
+# speedscope) are written.                          #
+#####################################################
+#
+# Stages nest: a "parse" inside a "load" is reported as "load;parse".
+# When instrumentation is off, stage() returns a shared do-nothing
+# context manager, so the wrapped code pays one function call.
+# Whole functions are wrapped with the @timed(name) decorator.
+# Stages run in the worker processes of a process pool are not
+# collected; the stage of the parent around the pool covers them.
+import atexit
+import contextlib
+import functools
+import json
+import os
+import time
+import tracemalloc
+
+# Default report file when DW_PROFILE is set to 1 / true / yes
+default_report_file = "dw_profile.json"
+
+enabled = False
+report_file = None
+
+# Statistics of every stage path, {"load;parse": {...}}, and the stack of
+# the stages currently running
+_stages = {}
+_stack = []
+_start = None
+
+_null_stage = contextlib.nullcontext()
+
+
+def enable(file_name=None):
+    """
+    Switch the instrumentation on, with the report written to file_name
+    (default: dw_profile.json) at exit.
+    """
+    global enabled, report_file, _start
+    report_file = file_name or default_report_file
+    if enabled:
+        return
+    enabled = True
+    _start = (time.perf_counter(), time.process_time())
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    atexit.register(write_report)
+
+
+@contextlib.contextmanager
+def _timed_stage(name):
+    # The peak of the enclosing stage is saved before tracemalloc's peak
+    # is reset for this one, and this peak is passed back up afterwards
+    if _stack:
+        _stack[-1]["peak"] = max(_stack[-1]["peak"], tracemalloc.get_traced_memory()[1])
+    tracemalloc.reset_peak()
+    path = ";".join([frame["name"] for frame in _stack] + [name])
+    frame = {"name": name, "peak": 0, "children_wall": 0.0}
+    _stack.append(frame)
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+        peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+        _stack.pop()
+        if _stack:
+            _stack[-1]["peak"] = max(_stack[-1]["peak"], peak)
+            _stack[-1]["children_wall"] += wall
+
+        statistics = _stages.setdefault(path, {"calls": 0, "wall_time": 0.0, "self_wall_time": 0.0,
+                                               "cpu_time": 0.0, "peak_memory": 0})
+        statistics["calls"] += 1
+        statistics["wall_time"] += wall
+        statistics["self_wall_time"] += wall - frame["children_wall"]
+        statistics["cpu_time"] += cpu
+        statistics["peak_memory"] = max(statistics["peak_memory"], peak)
+
+
+def stage(name):
+    """
+    Context manager timing one stage of the analysis:
+
+        with stage("parse"):
+            ...
+
+    Does nothing unless the instrumentation is enabled.
+    """
+    if not enabled:
+        return _null_stage
+    return _timed_stage(name)
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function as the stage name.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return timed_function
+    return decorate
+
+
+def report():
+    """
+    The statistics of every stage, as written to the JSON report.
+    """
+    wall, cpu = time.perf_counter() - _start[0], time.process_time() - _start[1]
+    return {"total_wall_time": wall,
+            "total_cpu_time": cpu,
+            "peak_memory": max([statistics["peak_memory"] for statistics in _stages.values()]
+                               + [tracemalloc.get_traced_memory()[1]]),
+            "stages": [dict(stage=path, **statistics)
+                       for path, statistics in sorted(_stages.items(),
+                                                      key=lambda item: item[1]["wall_time"], reverse=True)]}
+
+
+def write_report(file_name=None):
+    """
+    Write the JSON report and the folded stacks (self wall time of every
+    stage path in microseconds, one "a;b;c value" line each).
+    """
+    if not enabled:
+        return
+    # Pool workers inheriting DW_PROFILE do not overwrite the report
+    import multiprocessing
+    if multiprocessing.parent_process() is not None:
+        return
+    file_name = file_name or report_file
+    with open(file_name, 'w') as report_file_handle:
+        json.dump(report(), report_file_handle, indent=1)
+
+    folded_file = os.path.splitext(file_name)[0] + ".folded"
+    with open(folded_file, 'w') as folded_file_handle:
+        for path, statistics in _stages.items():
+            folded_file_handle.write(f"{path} {max(int(statistics['self_wall_time'] * 1e6), 0)}\n")
+
+
+# Switched on from the environment, for any script importing this module
+if os.environ.get("DW_PROFILE", "").strip().lower() not in ("", "0", "false", "no"):
+    _value = os.environ["DW_PROFILE"].strip()
+    enable(None if _value.lower() in ("1", "true", "yes") else _value)
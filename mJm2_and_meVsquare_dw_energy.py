@@ -5,6 +5,8 @@ supercell.
 8th May 2025 at 10:20
 By Stephen Chege
 """
+from units import eV_per_uc_to_mJ_per_m2, mJ_per_m2_to_meV_per_square
+
 # Getting the energy of the supercell in eV
 # ----------------------
 # Fully relaxed
@@ -124,32 +126,20 @@ def dw_energy(energy_supercell, lattice_b, lattice_c):
     dw_energy_in_eV_uc = (float(energy_supercell)-number_uc * energy_tetra)*0.5    
     # print(dw_energy_in_eV_uc, " eV per unit cell")
 
-    # Convert DW energy from eV to mJ
-    eV2J = 1.6022e-19
-    dw_energy_in_mJ_uc = dw_energy_in_eV_uc * eV2J * 1.e3
-    # print(dw_energy_in_mJ_uc, "mJ")
-    
-    # Area of PbO plane lattice_b x lattice_c, b and c are in Ang
-    area_in_meters_squared = float(lattice_b) * float(lattice_c) * 1.e-20
-    # print(area_in_meters_squared, "m^2")
-
-    # Energy of DW in eV per unit cell area
-    energy_in_mJ_per_meter_squared = (dw_energy_in_mJ_uc / area_in_meters_squared)
+    # Energy of DW per unit cell area, in mJ/m^2. The area of the PbO
+    # plane is lattice_b x lattice_c, b and c are in Ang
+    energy_in_mJ_per_meter_squared = eV_per_uc_to_mJ_per_m2(dw_energy_in_eV_uc, float(lattice_b), float(lattice_c))
     print(energy_in_mJ_per_meter_squared, "mJ/m^2")
 
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     # From mJ/m^2 to meV/$\square$  %
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
-    mJ2meV = 1 / eV2J
-    
-    # From mJ/m^2 to meV/m^2
-    energy_in_meV_per_meter_squared = energy_in_mJ_per_meter_squared * mJ2meV
-
-    # From meV/m^2 to meV/$square$ 
     # where $\square$ represents the cell surface area of the DW
-    energy_in_meV_per_square = energy_in_meV_per_meter_squared * area_in_meters_squared
+    energy_in_meV_per_square = mJ_per_m2_to_meV_per_square(energy_in_mJ_per_meter_squared,
+                                                           float(lattice_b), float(lattice_c))
 
     print(energy_in_meV_per_square, "meV/$square$")
 
 
-dw_energy(energy_supercell, lattice_b, lattice_c)
+if __name__ == "__main__":
+    dw_energy(energy_supercell, lattice_b, lattice_c)
@@ -0,0 +1,172 @@
+"""
+Final total energy and relaxed cell from SIESTA and ABINIT outputs.
+
+The output file is memory-mapped and searched backward from the end for
+the last occurrence of each marker, so only the tail of a relaxation log
+of hundreds of MB is actually read.
+
+SIESTA (.out):
+    energy : last "siesta:         Total =" line (eV)
+    cell   : last "outcell: Cell vector modules (Ang)" line
+
+ABINIT (main output or log):
+    energy : last ">>>>>>>>> Etotal=" line, or the "etotal" echoed after
+             computation (Ha, converted to eV)
+    cell   : last "R(1)= ... R(3)=" primitive vectors block (Bohr,
+             converted to Ang)
+
+Usage:
+    python output_parser.py runs/*/siesta.out
+"""
+import mmap
+import re
+import sys
+
+import numpy as np
+
+from units import Bohr_to_Ang, Hartree_to_eV
+
+# Markers of the final values, searched from the end of the file
+siesta_energy_marker = b"siesta:         Total ="
+siesta_cell_marker = b"outcell: Cell vector modules (Ang)"
+siesta_cell_vectors_marker = b"outcell: Unit cell vectors (Ang):"
+abinit_energy_markers = [(b">>>>>>>>> Etotal=", re.compile(rb">>>>>>>>> Etotal=\s*(\S+)")),
+                         (b" etotal", re.compile(rb"^\s*etotal\d*\s+(\S+)"))]
+abinit_cell_marker = b"R(1)="
+
+float_pattern = re.compile(rb"[-+]?\d+\.?\d*(?:[EeDd][-+]?\d+)?")
+
+
+def _line_at(mapped_file, position):
+    """
+    Start, end and content of the line of mapped_file containing position.
+    """
+    start = mapped_file.rfind(b"\n", 0, position) + 1
+    end = mapped_file.find(b"\n", position)
+    if end == -1:
+        end = len(mapped_file)
+    return start, end, mapped_file[start:end]
+
+
+def lines_from(mapped_file, position, number_of_lines):
+    """
+    The number_of_lines lines of mapped_file starting at position, read
+    without copying the rest of the file.
+    """
+    lines = []
+    for _ in range(number_of_lines):
+        end = mapped_file.find(b"\n", position)
+        if end == -1:
+            end = len(mapped_file)
+        lines.append(mapped_file[position:end])
+        position = end + 1
+    return lines
+
+
+def last_line_with(mapped_file, marker):
+    """
+    Last line of mapped_file containing marker, found by a backward
+    search from the end of the file, or None.
+    """
+    position = mapped_file.rfind(marker)
+    if position == -1:
+        return None
+    return _line_at(mapped_file, position)
+
+
+def _floats(text):
+    return [float(value.replace(b"D", b"E").replace(b"d", b"e")) for value in float_pattern.findall(text)]
+
+
+def _open_mapped(file_name):
+    with open(file_name, 'rb') as output_file:
+        if output_file.seek(0, 2) == 0:
+            raise ValueError(f"{file_name} is empty")
+        return mmap.mmap(output_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def detect_code(file_name):
+    """
+    "SIESTA" or "ABINIT", from the first 64 kB of the output file.
+    """
+    with open(file_name, 'rb') as output_file:
+        head = output_file.read(1 << 16)
+    if b"siesta" in head.lower():
+        return "SIESTA"
+    if b"abinit" in head.lower():
+        return "ABINIT"
+    raise ValueError(f"Cannot tell whether {file_name} is a SIESTA or an ABINIT output")
+
+
+def siesta_final_results(file_name):
+    """
+    Final total energy (eV) and cell vector lengths (Ang) of a SIESTA output.
+    """
+    with _open_mapped(file_name) as mapped_file:
+        line = last_line_with(mapped_file, siesta_energy_marker)
+        if line is None:
+            raise ValueError(f"{file_name}: no final total energy found")
+        energy = _floats(line[2][len(siesta_energy_marker):].split(b"=", 1)[-1])[0]
+
+        line = last_line_with(mapped_file, siesta_cell_marker)
+        if line is not None:
+            cell_lengths = _floats(line[2].split(b":", 2)[-1])[0:3]
+        else:
+            # Older versions only print the cell vectors
+            line = last_line_with(mapped_file, siesta_cell_vectors_marker)
+            if line is None:
+                raise ValueError(f"{file_name}: no relaxed cell found")
+            vectors = lines_from(mapped_file, line[1] + 1, 3)
+            cell_lengths = np.linalg.norm([_floats(vector)[-3:] for vector in vectors], axis=1).tolist()
+
+    return {"code": "SIESTA", "energy_supercell": energy, "cell_lengths": cell_lengths}
+
+
+def abinit_final_results(file_name):
+    """
+    Final total energy (eV) and cell vector lengths (Ang) of an ABINIT
+    output or log.
+    """
+    with _open_mapped(file_name) as mapped_file:
+        energy = None
+        for marker, pattern in abinit_energy_markers:
+            line = last_line_with(mapped_file, marker)
+            match = pattern.search(line[2]) if line is not None else None
+            if match:
+                energy = float(Hartree_to_eV(_floats(match.group(1))[0]))
+                break
+        if energy is None:
+            raise ValueError(f"{file_name}: no final total energy found")
+
+        line = last_line_with(mapped_file, abinit_cell_marker)
+        if line is None:
+            raise ValueError(f"{file_name}: no relaxed cell found")
+        # R(1)=, R(2)= and R(3)= are on three consecutive lines, each
+        # followed by the reciprocal vector G(i)=
+        lines = lines_from(mapped_file, line[0], 3)
+        vectors = [_floats(text.split(b"=", 1)[1].split(b"G(", 1)[0])[0:3] for text in lines]
+        cell_lengths = Bohr_to_Ang(np.linalg.norm(vectors, axis=1)).tolist()
+
+    return {"code": "ABINIT", "energy_supercell": energy, "cell_lengths": cell_lengths}
+
+
+def final_results(file_name, code=None):
+    """
+    Final total energy (eV) and cell vector lengths a, b, c (Ang) of a
+    SIESTA or ABINIT output. code is detected from the file if not given.
+    """
+    code = (code or detect_code(file_name)).upper()
+    if code == "SIESTA":
+        return siesta_final_results(file_name)
+    if code == "ABINIT":
+        return abinit_final_results(file_name)
+    raise ValueError(f"Unknown code {code}, expected SIESTA or ABINIT")
+
+
+if __name__ == "__main__":
+    print(f"{'file':<50} {'code':<7} {'energy (eV)':>18} {'a (Ang)':>12} {'b (Ang)':>10} {'c (Ang)':>10}")
+    for output_file in sys.argv[1:]:
+        results = final_results(output_file)
+        a, b, c = results["cell_lengths"]
+        print(f"{output_file:<50} {results['code']:<7} {results['energy_supercell']:>18.6f} "
+              f"{a:>12.6f} {b:>10.6f} {c:>10.6f}")
@@ -0,0 +1,326 @@
+#####################################################
+# Incremental pipeline of the DW analysis of many   #
+# run directories:                                  #
+#                                                   #
+#   POSCAR -> PbTiO3.XV -> PbTiO3.XV.P.dat          #
+#          -> dw_width.json, pol_profile.png        #
+#   SIESTA/ABINIT output -> dw_energy.json          #
+#                                                   #
+# Every stage of a run is keyed by the SHA-256 of   #
+# its input files and parameters, kept in           #
+# .dw_pipeline.json in the run directory. A stage   #
+# runs again only when that key changed or one of   #
+# its outputs is missing or was modified, so after  #
+# a new relaxation of one substrate only that run   #
+# is recomputed, and only the stages downstream of  #
+# the files whose content changed. The runs are     #
+# independent and go to a process pool.             #
+#                                                   #
+# Usage:                                            #
+#   python pipeline.py "runs/*" --reference ref.XV  #
+#####################################################
+#
+# Without --reference, PbTiO3.XV.P.dat is taken as an input of the run
+# (e.g. computed outside this repository) and the profile stage is left
+# out. A stage whose input files are missing is skipped as well, so run
+# directories holding only a profile, or only an output file, also work.
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from profile_loader import _natural_key
+from structure_cache import source_hash
+
+# Pipeline state file written in each run directory
+state_file_name = ".dw_pipeline.json"
+
+# Default options of the stages
+default_options = {"poscar": "*_HIST.poscar",       # POSCAR of the run, glob pattern
+                   "reference": None,               # centrosymmetric reference structure (XV)
+                   "output": "siesta.out",          # SIESTA / ABINIT output, glob pattern
+                   "window": 10,                    # layers on each side of the DW (width fit)
+                   "uncertainty": "covariance",     # width error bars
+                   "number_uc": 20,                 # unit cells in the supercell (energy)
+                   "energy_tetra": None,            # bulk reference energy (default: that of the code)
+                   "dpi": 300}                      # figure resolution
+
+
+def _one_file(run_directory, pattern):
+    # The single file of the run matching pattern, or None
+    if not pattern:
+        return None
+    matches = sorted(glob.glob(os.path.join(run_directory, pattern)))
+    if len(matches) > 1:
+        raise ValueError(f"{run_directory}: several files match {pattern}: {', '.join(matches)}")
+    return matches[0] if matches else None
+
+
+# ---------------------------- Stages ---------------------------- #
+# Each stage gives its input files and parameters for a run, its output
+# files, and the function computing them: run(inputs, outputs, params).
+
+def _run_xv(inputs, outputs, params):
+    from POSCAR2XV import convert_poscar
+
+    convert_poscar(inputs[0], outputs[0])
+
+
+def _run_profile(inputs, outputs, params):
+    from polarization_engine import polarization_from_XV, write_polarization_file
+
+    write_polarization_file(outputs[0], polarization_from_XV(inputs[0], inputs[1]))
+
+
+def _run_width(inputs, outputs, params):
+    from dw_width import fit_dw_width
+
+    result = fit_dw_width(inputs[0], params["window"], params["uncertainty"])
+    width = {name: float(value) for name, value in zip(["Po", "delta", "x0"], result["params"])}
+    if result["resampling"] is None:
+        width["errors"] = [float(error) for error in result["params_error"]]
+    else:
+        width["ci_low"] = [float(value) for value in result["resampling"]["ci_low"]]
+        width["ci_high"] = [float(value) for value in result["resampling"]["ci_high"]]
+        width["robust_std"] = [float(value) for value in result["resampling"]["robust_std"]]
+        width["dropped"] = int(result["resampling"]["dropped"])
+    _write_json(outputs[0], width)
+
+
+def _run_energy(inputs, outputs, params):
+    from dw_energy_table import dw_energies, single_configuration
+    from output_parser import final_results
+
+    results = final_results(inputs[0])
+    _, lattice_b, lattice_c = results["cell_lengths"]
+    configuration = single_configuration(results["energy_supercell"], lattice_b, lattice_c, results["code"],
+                                         params["number_uc"], params["energy_tetra"])
+    energies = dw_energies(configuration)
+    _write_json(outputs[0], {
+        "code": results["code"],
+        "energy_supercell": float(results["energy_supercell"]),
+        "lattice_b": float(lattice_b),
+        "lattice_c": float(lattice_c),
+        "energy_tetra": float(configuration["energy_tetra"][0]),
+        "dw_energy_eV_per_uc": float(energies["dw_energy_eV_per_uc"][0]),
+        "dw_energy_mJ_per_m2": float(energies["dw_energy_mJ_per_m2"][0]),
+        "dw_energy_meV_per_square": float(energies["dw_energy_meV_per_square"][0])})
+
+
+def _run_figure(inputs, outputs, params):
+    from render_figures import profile_spec, render
+
+    render(profile_spec(inputs[0], outputs[0], dpi=params["dpi"]))
+
+
+stages = [
+    {"name": "xv",
+     "inputs": lambda run, options: [_one_file(run, options["poscar"])],
+     "params": lambda options: {},
+     "outputs": ["PbTiO3.XV"],
+     "run": _run_xv},
+    {"name": "profile",
+     "inputs": lambda run, options: [os.path.join(run, "PbTiO3.XV"), options["reference"]],
+     "params": lambda options: {},
+     "outputs": ["PbTiO3.XV.P.dat"],
+     "run": _run_profile},
+    {"name": "width",
+     "inputs": lambda run, options: [os.path.join(run, "PbTiO3.XV.P.dat")],
+     "params": lambda options: {"window": options["window"], "uncertainty": options["uncertainty"]},
+     "outputs": ["dw_width.json"],
+     "run": _run_width},
+    {"name": "energy",
+     "inputs": lambda run, options: [_one_file(run, options["output"])],
+     "params": lambda options: {"number_uc": options["number_uc"], "energy_tetra": options["energy_tetra"]},
+     "outputs": ["dw_energy.json"],
+     "run": _run_energy},
+    {"name": "figure",
+     "inputs": lambda run, options: [os.path.join(run, "PbTiO3.XV.P.dat")],
+     "params": lambda options: {"dpi": options["dpi"]},
+     "outputs": ["pol_profile.png"],
+     "run": _run_figure},
+]
+
+
+# ---------------------------- Runner ---------------------------- #
+
+def _write_json(file_name, content):
+    with open(file_name + ".tmp", 'w') as json_file:
+        json.dump(content, json_file, indent=1)
+    os.replace(file_name + ".tmp", file_name)
+
+
+def load_state(run_directory):
+    """
+    Keys and output hashes of the stages last run in run_directory.
+    """
+    try:
+        with open(os.path.join(run_directory, state_file_name), 'r') as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def stage_key(stage, inputs, params):
+    """
+    SHA-256 of the stage name, its parameters and the content of its
+    input files.
+    """
+    content = {"stage": stage["name"], "params": params,
+               "inputs": [source_hash(input_file) for input_file in inputs]}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def run_pipeline(run_directory, options=None, force=False):
+    """
+    Run the stages of one run directory whose inputs changed.
+
+    A stage that raises is reported as "failed: <error>" and the stages
+    reading its outputs as "skipped", so that they do not run on stale
+    files; the independent stages of the run still run.
+
+    Returns:
+    dictionary {stage name: "ran", "up to date", "no input", "skipped" or
+    "failed: <error>"}
+    """
+    options = dict(default_options, **(options or {}))
+    state = load_state(run_directory)
+    status = {}
+    failed_outputs = set()
+
+    for stage in stages:
+        inputs = stage["inputs"](run_directory, options)
+        if failed_outputs.intersection(inputs):
+            failed_outputs.update(os.path.join(run_directory, output) for output in stage["outputs"])
+            status[stage["name"]] = "skipped"
+            continue
+        if any(input_file is None or not os.path.isfile(input_file) for input_file in inputs):
+            status[stage["name"]] = "no input"
+            continue
+
+        params = stage["params"](options)
+        outputs = [os.path.join(run_directory, output) for output in stage["outputs"]]
+        key = stage_key(stage, inputs, params)
+
+        previous = state.get(stage["name"], {})
+        up_to_date = (not force and previous.get("key") == key
+                      and all(os.path.isfile(output) for output in outputs)
+                      and previous.get("outputs") == [source_hash(output) for output in outputs])
+        if up_to_date:
+            status[stage["name"]] = "up to date"
+            continue
+
+        try:
+            stage["run"](inputs, outputs, params)
+        except Exception as error:
+            failed_outputs.update(outputs)
+            state.pop(stage["name"], None)
+            _write_json(os.path.join(run_directory, state_file_name), state)
+            status[stage["name"]] = f"failed: {type(error).__name__}: {error}"
+            continue
+        state[stage["name"]] = {"key": key, "outputs": [source_hash(output) for output in outputs]}
+        _write_json(os.path.join(run_directory, state_file_name), state)
+        status[stage["name"]] = "ran"
+
+    return status
+
+
+def _run_pipeline_worker(arguments):
+    run_directory, options, force = arguments
+    # Figures are rendered headless in the workers
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    # A run failing outside its stages (e.g. several POSCAR files matching)
+    # must not abort the others: its error is reported as its status instead
+    try:
+        return run_pipeline(run_directory, options, force)
+    except Exception as error:
+        return {stage["name"]: f"failed: {type(error).__name__}: {error}" for stage in stages}
+
+
+def run_directories(patterns):
+    """
+    Directories matching the glob patterns, in natural order.
+    """
+    directories = {directory for pattern in patterns for directory in glob.glob(pattern)
+                   if os.path.isdir(directory)}
+    return sorted(directories, key=_natural_key)
+
+
+def run_all(patterns, options=None, processes=None, force=False):
+    """
+    Run the pipeline of all the run directories matching the glob
+    patterns, the runs in parallel worker processes.
+
+    Returns:
+    dictionary {run directory: status of its stages, see run_pipeline}; a
+    run that raised gets "failed: <error>" for every stage, and the other
+    runs are completed
+    """
+    directories = run_directories(patterns)
+    if not directories:
+        raise FileNotFoundError(f"No run directory matches {patterns}")
+
+    # Relative paths in the options would not be found from every run
+    options = dict(options or {})
+    if options.get("reference"):
+        options["reference"] = os.path.abspath(options["reference"])
+
+    work = [(directory, options, force) for directory in directories]
+    if processes == 1 or len(directories) == 1:
+        return dict(zip(directories, map(_run_pipeline_worker, work)))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return dict(zip(directories, pool.map(_run_pipeline_worker, work)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental DW analysis pipeline of many run directories.")
+    parser.add_argument("runs", nargs="+", help="run directories or glob patterns, e.g. 'runs/*'")
+    parser.add_argument("--poscar", default=default_options["poscar"],
+                        help=f"POSCAR of each run, glob pattern (default: {default_options['poscar']})")
+    parser.add_argument("--reference", default=None,
+                        help="centrosymmetric reference structure (XV) for the polarization profiles "
+                             "(default: PbTiO3.XV.P.dat is an input of the runs)")
+    parser.add_argument("--output", default=default_options["output"],
+                        help=f"SIESTA / ABINIT output of each run, glob pattern (default: {default_options['output']})")
+    parser.add_argument("-w", "--window", type=int, default=default_options["window"],
+                        help="layers on each side of the DW in the width fit")
+    parser.add_argument("-u", "--uncertainty", choices=["covariance", "bootstrap", "jackknife"],
+                        default=default_options["uncertainty"], help="error bars of the width fit")
+    parser.add_argument("--number-uc", type=int, default=default_options["number_uc"],
+                        help="unit cells in the supercell, for the DW energy")
+    parser.add_argument("--energy-tetra", type=float, default=None,
+                        help="energy of the bulk tetragonal unit cell (eV) (default: that of the code; "
+                             "required for ABINIT)")
+    parser.add_argument("--dpi", type=int, default=default_options["dpi"])
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("-f", "--force", action="store_true", help="run every stage again")
+    args = parser.parse_args()
+
+    options = {"poscar": args.poscar, "reference": args.reference, "output": args.output,
+               "window": args.window, "uncertainty": args.uncertainty,
+               "number_uc": args.number_uc, "energy_tetra": args.energy_tetra, "dpi": args.dpi}
+
+    start = time.perf_counter()
+    statuses = run_all(args.runs, options, args.processes, args.force)
+    elapsed = time.perf_counter() - start
+
+    print(f"{'run':<40} " + " ".join(f"{stage['name']:>10}" for stage in stages))
+    for directory, status in statuses.items():
+        print(f"{directory:<40} " + " ".join(f"{status[stage['name']].split(':')[0]:>10}" for stage in stages))
+    number_ran = sum(state == "ran" for status in statuses.values() for state in status.values())
+    print(f"{number_ran} stage(s) run in {elapsed:.2f} s")
+
+    failures = {}
+    for directory, status in statuses.items():
+        for name, state in status.items():
+            if state.startswith("failed"):
+                failures.setdefault((directory, state), []).append(name)
+    for (directory, state), names in failures.items():
+        print(f"{directory}: {', '.join(names)} {state}")
+    if failures:
+        sys.exit(1)
@@ -0,0 +1,236 @@
+#####################################################
+# Layer-by-layer polarization of a PbTiO3 DW        #
+# supercell, computed from the XV file written by   #
+# POSCAR2XV.py, Born effective charges and a        #
+# centrosymmetric reference structure.              #
+#                                                   #
+# Writes PbTiO3.XV.P.dat: layer position (Ang), Px, #
+# Py, Pz (C/m^2), one line per PbO / TiO2 layer.    #
+#####################################################
+#
+# The polarization of a layer is that of the unit cell centred on it: the
+# Born-charge weighted displacements from the reference structure of the
+# atoms of the layer and of half the atoms of the two neighbouring layers
+# (shared with the next cells), over the unit-cell volume:
+#
+#     P_l = e / Omega_cell * [d_l + (d_{l-1} + d_{l+1}) / 2],
+#     d_l = sum_{i in layer l} Z*_i . (r_i - r_i^ref)
+#
+# so that a uniformly polarized supercell gives a flat profile. Layers are
+# the PbO and TiO2 planes perpendicular to the first lattice vector (the
+# DW normal), two per unit cell. All the atoms are handled at once: the
+# dipoles with one einsum and the sums per layer with np.bincount.
+import argparse
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from instrumentation import timed
+from POSCAR2XV import read_XV
+from units import bohr_in_Ang, e_per_Ang2_to_C_per_m2
+
+# Born effective charges of cubic PbTiO3 (in e), Zhong, King-Smith and
+# Vanderbilt, PRL 72, 3618 (1994). O has a parallel charge along its Ti-O
+# bond and a perpendicular one in the two other directions.
+PbTiO3_born_charges = {82: 3.90,            # Pb
+                       22: 7.06,            # Ti
+                       8: (-5.83, -2.56)}   # O parallel, O perpendicular
+
+# Ti, whose nearest O neighbours along the Ti-O bonds get the parallel charge
+Ti_atomic_number = 22
+
+# Atoms per unit cell and layers per unit cell (PbO and TiO2)
+atoms_per_cell = 5
+layers_per_cell = 2
+
+
+def supercell_repetitions(lattice_vectors, number_of_atoms):
+    """
+    Number of unit cells along each lattice vector, from the supercell
+    volume per formula unit.
+    """
+    lengths = np.linalg.norm(lattice_vectors, axis=1)
+    number_of_cells = number_of_atoms // atoms_per_cell
+    cell_length = (abs(np.linalg.det(lattice_vectors)) / number_of_cells) ** (1 / 3)
+    return np.maximum(np.rint(lengths / cell_length).astype(int), 1)
+
+
+def born_charge_tensors(atomic_numbers, fractional_coordinates, repetitions, born_charges=None):
+    """
+    Born effective charge tensor of every atom.
+
+    Parameters:
+    atomic_numbers         : (N,) atomic numbers
+    fractional_coordinates : (N, 3) fractional coordinates of the reference
+                             structure, used to find the nearest Ti of each O
+    repetitions            : unit cells along each lattice vector
+    born_charges           : per-atom (N, 3, 3) tensors, or a dictionary
+                             {atomic number: Z} with Z a scalar (isotropic) or
+                             a (parallel, perpendicular) pair for O
+                             (default: PbTiO3_born_charges)
+
+    Returns:
+    (N, 3, 3) Born effective charges
+    """
+    if born_charges is None:
+        born_charges = PbTiO3_born_charges
+    if not isinstance(born_charges, dict):
+        born_charges = np.asarray(born_charges, dtype=float)
+        if born_charges.shape != (len(atomic_numbers), 3, 3):
+            raise ValueError(f"Born charges must be a ({len(atomic_numbers)}, 3, 3) array")
+        return born_charges
+
+    missing = set(np.unique(atomic_numbers).tolist()) - set(born_charges)
+    if missing:
+        raise ValueError(f"No Born charge given for atomic number(s) {sorted(missing)}")
+
+    parallel = np.zeros(len(atomic_numbers))
+    perpendicular = np.zeros(len(atomic_numbers))
+    for atomic_number, charge in born_charges.items():
+        atoms = atomic_numbers == atomic_number
+        parallel[atoms], perpendicular[atoms] = np.broadcast_to(charge, (2,))
+
+    # The parallel axis of an O is the dominant axis of the displacement to
+    # its nearest Ti (minimum image), in unit-cell units so that it does not
+    # depend on where the origin of the cell is
+    bond_axis = np.zeros(len(atomic_numbers), dtype=int)
+    anisotropic = np.flatnonzero(parallel != perpendicular)
+    if len(anisotropic):
+        titanium = np.flatnonzero(atomic_numbers == Ti_atomic_number)
+        if not len(titanium):
+            raise ValueError("Parallel and perpendicular Born charges need Ti atoms to find the Ti-O bonds")
+        box = np.asarray(repetitions, dtype=float)
+        cell_coordinates = np.mod(fractional_coordinates * box, box)
+        cell_coordinates[cell_coordinates >= box] = 0.0
+        _, nearest = cKDTree(cell_coordinates[titanium], boxsize=box).query(cell_coordinates[anisotropic])
+        bond = cell_coordinates[titanium[nearest]] - cell_coordinates[anisotropic]
+        bond -= box * np.rint(bond / box)
+        bond_axis[anisotropic] = np.argmax(np.abs(bond), axis=1)
+
+    diagonal = np.repeat(perpendicular[:, None], 3, axis=1)
+    diagonal[np.arange(len(atomic_numbers)), bond_axis] = parallel
+    tensors = np.zeros((len(atomic_numbers), 3, 3))
+    tensors[:, [0, 1, 2], [0, 1, 2]] = diagonal
+    return tensors
+
+
+@timed("polarization")
+def layer_polarization(coordinates, reference_coordinates, lattice_vectors, born_charges,
+                       number_of_layers):
+    """
+    Layer-by-layer polarization of one structure, each layer's being that
+    of the unit cell centred on it.
+
+    Parameters:
+    coordinates           : (N, 3) Cartesian coordinates (Ang)
+    reference_coordinates : (N, 3) Cartesian coordinates of the reference
+                            centrosymmetric structure (Ang), same atom order
+    lattice_vectors       : (3, 3) lattice vectors (Ang), one per row
+    born_charges          : (N, 3, 3) Born effective charges (e)
+    number_of_layers      : number of layers along the first lattice vector
+
+    Returns:
+    (number_of_layers, 4) array of layer position (Ang), Px, Py, Pz (C/m^2)
+    """
+    inverse_lattice = np.linalg.inv(lattice_vectors)
+    reference_fractional = reference_coordinates @ inverse_lattice
+
+    # Displacements with the minimum image convention
+    displacement_fractional = coordinates @ inverse_lattice - reference_fractional
+    displacement_fractional -= np.rint(displacement_fractional)
+    displacements = displacement_fractional @ lattice_vectors
+
+    # Layer of every atom, from its reference position along the DW normal
+    layer_coordinate = reference_fractional[:, 0] * number_of_layers
+    layer = np.rint(layer_coordinate).astype(int) % number_of_layers
+
+    # Born-charge weighted dipoles (e Ang) summed in each layer
+    dipoles = np.einsum('nij,nj->ni', born_charges, displacements)
+    layer_dipoles = np.stack([np.bincount(layer, weights=dipoles[:, k], minlength=number_of_layers)
+                              for k in range(3)], axis=1)
+
+    # Dipole of the unit cell centred on every layer: the layer and half of
+    # each neighbouring layer (periodic supercell)
+    cell_dipoles = layer_dipoles + 0.5 * (np.roll(layer_dipoles, 1, axis=0) + np.roll(layer_dipoles, -1, axis=0))
+    cell_volume = abs(np.linalg.det(lattice_vectors)) / (number_of_layers / layers_per_cell)
+    polarization = cell_dipoles / cell_volume * e_per_Ang2_to_C_per_m2
+
+    # Layer position along the DW normal: mean position of its atoms
+    a_length = np.linalg.norm(lattice_vectors[0])
+    offset = (layer_coordinate - np.rint(layer_coordinate) + displacement_fractional[:, 0] * number_of_layers)
+    atoms_per_layer = np.bincount(layer, minlength=number_of_layers)
+    mean_offset = np.bincount(layer, weights=offset, minlength=number_of_layers) / np.maximum(atoms_per_layer, 1)
+    layer_positions = (np.arange(number_of_layers) + mean_offset) * a_length / number_of_layers
+
+    return np.column_stack([layer_positions, polarization])
+
+
+def polarization_from_XV(xv_file, reference_file, born_charges=None):
+    """
+    Layer-by-layer polarization of the structure in xv_file, relative to
+    the centrosymmetric structure in reference_file (both XV files with
+    the same atom order).
+
+    Returns:
+    (layers, 4) array of layer position (Ang), Px, Py, Pz (C/m^2)
+    """
+    structure = read_XV(xv_file)
+    reference = read_XV(reference_file)
+    if not np.array_equal(structure["atomic_numbers"], reference["atomic_numbers"]):
+        raise ValueError(f"{xv_file} and {reference_file} do not have the same atoms in the same order")
+
+    lattice_vectors = structure["lattice_vectors"] * bohr_in_Ang
+    coordinates = structure["coordinates"] * bohr_in_Ang
+    reference_coordinates = reference["coordinates"] * bohr_in_Ang
+
+    repetitions = supercell_repetitions(lattice_vectors, len(coordinates))
+    tensors = born_charge_tensors(structure["atomic_numbers"],
+                                  reference_coordinates @ np.linalg.inv(lattice_vectors),
+                                  repetitions, born_charges)
+
+    return layer_polarization(coordinates, reference_coordinates, lattice_vectors, tensors,
+                              layers_per_cell * repetitions[0])
+
+
+def write_polarization_file(file_name, polarization):
+    """
+    Write a layer-by-layer polarization table in the PbTiO3.XV.P.dat format.
+    """
+    np.savetxt(file_name, polarization, fmt="%16.8f",
+               header="Layer position (Ang)     Px (C/m^2)      Py (C/m^2)      Pz (C/m^2)")
+
+
+def write_profile(xv_file, reference_file, output=None, born_charges_file=None):
+    """
+    Compute the layer-by-layer polarization of xv_file and write it to
+    output (default: <xv_file>.P.dat), as run by this script and by
+    "dw.py profile".
+
+    Parameters:
+    born_charges_file : text file with the 9 components of the Born charge
+                        tensor of every atom, one atom per line
+                        (default: cubic PbTiO3 values)
+
+    Returns:
+    the output file
+    """
+    born_charges = None
+    if born_charges_file:
+        born_charges = np.loadtxt(born_charges_file, comments="#", ndmin=2).reshape(-1, 3, 3)
+
+    output = output or xv_file + ".P.dat"
+    write_polarization_file(output, polarization_from_XV(xv_file, reference_file, born_charges))
+    return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Layer-by-layer polarization from an XV file.")
+    parser.add_argument("xv_file", nargs="?", default="PbTiO3.XV", help="structure (default: PbTiO3.XV)")
+    parser.add_argument("reference_file", help="centrosymmetric reference structure (XV file)")
+    parser.add_argument("-o", "--output", default=None, help="output file (default: <xv_file>.P.dat)")
+    parser.add_argument("--born-charges", default=None,
+                        help="text file with the 9 components of the Born charge tensor of every "
+                             "atom, one atom per line (default: cubic PbTiO3 values)")
+    args = parser.parse_args()
+
+    write_profile(args.xv_file, args.reference_file, args.output, args.born_charges)
@@ -9,13 +9,15 @@ import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 
+from structure_cache import load_polarization
+
 ## -------------------------------------------- LOAD DATA ------------------------------------- ##
 
-# Load the data, skipping the header
-polarization_data = np.loadtxt("PbTiO3.XV.P.dat", comments="#")
+# Load the data, skipping the header (parsed once, then memory-mapped from .dw_cache)
+polarization_data = load_polarization("PbTiO3.XV.P.dat")
 
 # ABINIT polarization data
-abinit_pol_data = np.loadtxt("results_pol_fullyrelaxed.dat", comments="#")
+abinit_pol_data = load_polarization("results_pol_fullyrelaxed.dat")
 
 # Extract columns for SIESTA polarization data
 x_supercell = polarization_data[:, 0] #Length of supercell along x-axis in Angstroms
@@ -92,11 +94,17 @@ ax.text(x_supercell[0], np.max(Pz), "(a)", fontsize=14)
 WINDOW = 6 # number of layers away from center of DW
 CODW = int(len(x_supercell) / 2) # center of DW
 x_axis_inset_coord_siesta = x_supercell[CODW - WINDOW: CODW + WINDOW]
-x_axis_inset_coord_abinit = abinit_layer_pos[CODW - WINDOW: CODW + WINDOW]
+
+# The ABINIT layers need not sit at the SIESTA indices: take those whose
+# positions fall within the SIESTA window (half a layer spacing either side)
+inset_low = (x_supercell[CODW - WINDOW - 1] + x_supercell[CODW - WINDOW]) / 2
+inset_high = (x_supercell[CODW + WINDOW - 1] + x_supercell[CODW + WINDOW]) / 2
+abinit_inset = (abinit_layer_pos > inset_low) & (abinit_layer_pos < inset_high)
+x_axis_inset_coord_abinit = abinit_layer_pos[abinit_inset]
 
 # Px polarization values around DW
 y_axis_inset_coord_siesta = Px[CODW - WINDOW:CODW+WINDOW]
-y_axis_inset_coord_abinit = abinit_Px[CODW - WINDOW:CODW+WINDOW]
+y_axis_inset_coord_abinit = abinit_Px[abinit_inset]
 
 
 # Inset plot
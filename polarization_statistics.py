@@ -0,0 +1,132 @@
+#####################################################
+# Time-averaged layer-by-layer polarization and its #
+# fluctuations over an MD / relaxation trajectory.  #
+#                                                   #
+# Frames are read one at a time from a              #
+# _HIST.poscar trajectory and folded into running   #
+# per-layer means and variances (Welford's          #
+# algorithm), so memory does not grow with the      #
+# length of the trajectory.                         #
+#####################################################
+import argparse
+import os
+
+import numpy as np
+
+from POSCAR2XV import read_poscar_frames, read_XV
+from polarization_engine import (born_charge_tensors, layer_polarization, layers_per_cell,
+                                 supercell_repetitions)
+
+
+def new_accumulator(number_of_layers, number_of_columns=4):
+    """
+    Empty running statistics of a (layers, columns) polarization table.
+    """
+    return {"count": 0,
+            "mean": np.zeros((number_of_layers, number_of_columns)),
+            "m2": np.zeros((number_of_layers, number_of_columns))}
+
+
+def update_accumulator(accumulator, table):
+    """
+    Fold one (layers, columns) polarization table into the running mean
+    and sum of squared deviations (Welford's update).
+    """
+    accumulator["count"] += 1
+    delta = table - accumulator["mean"]
+    accumulator["mean"] += delta / accumulator["count"]
+    accumulator["m2"] += delta * (table - accumulator["mean"])
+
+
+def accumulator_statistics(accumulator):
+    """
+    Mean and (sample) variance of the tables folded into the accumulator.
+    """
+    count = accumulator["count"]
+    if count == 0:
+        raise ValueError("No frame was accumulated")
+    variance = accumulator["m2"] / (count - 1) if count > 1 else np.zeros_like(accumulator["m2"])
+    return accumulator["mean"], variance
+
+
+def polarization_frames(trajectory_file, reference_file, born_charges=None):
+    """
+    Generator of the layer-by-layer polarization table (position, Px, Py,
+    Pz) of every frame of a POSCAR / _HIST.poscar trajectory, or of a
+    trajectory container directory (see trajectory_store.py).
+
+    The reference centrosymmetric structure (XV file, same atom order) is
+    given in fractional coordinates, so it follows the cell of each frame
+    in variable-cell runs.
+    """
+    reference = read_XV(reference_file)
+    reference_fractional = reference["coordinates"] @ np.linalg.inv(reference["lattice_vectors"])
+
+    if os.path.isdir(trajectory_file):
+        from trajectory_store import open_trajectory, trajectory_frames
+
+        frames = trajectory_frames(open_trajectory(trajectory_file))
+    else:
+        frames = read_poscar_frames(trajectory_file)
+
+    tensors = None
+    for frame in frames:
+        lattice_vectors = frame["lattice_vectors"] * frame["scaling_factor"]
+        coordinates = frame["coordinates"] @ lattice_vectors
+
+        # The Born charges and the layers do not change along the trajectory
+        if tensors is None:
+            repetitions = supercell_repetitions(lattice_vectors, len(coordinates))
+            tensors = born_charge_tensors(reference["atomic_numbers"], reference_fractional,
+                                          repetitions, born_charges)
+            number_of_layers = layers_per_cell * repetitions[0]
+
+        yield layer_polarization(coordinates, reference_fractional @ lattice_vectors,
+                                 lattice_vectors, tensors, number_of_layers)
+
+
+def trajectory_statistics(trajectory_file, reference_file, born_charges=None, skip=0):
+    """
+    Time-averaged layer-by-layer polarization over a trajectory.
+
+    Parameters:
+    trajectory_file : POSCAR / _HIST.poscar trajectory, or trajectory container
+    reference_file  : centrosymmetric reference structure (XV file)
+    born_charges    : see polarization_engine.born_charge_tensors
+    skip            : number of initial (equilibration) frames left out
+
+    Returns:
+    (layers, 7) array: layer position (Ang), mean Px, Py, Pz and the
+    variances of Px, Py, Pz (C/m^2 and (C/m^2)^2), and the number of frames
+    """
+    accumulator = None
+    for frame_number, table in enumerate(polarization_frames(trajectory_file, reference_file, born_charges)):
+        if frame_number < skip:
+            continue
+        if accumulator is None:
+            accumulator = new_accumulator(*table.shape)
+        update_accumulator(accumulator, table)
+
+    if accumulator is None:
+        raise ValueError(f"No frame left in {trajectory_file} after skipping {skip}")
+
+    mean, variance = accumulator_statistics(accumulator)
+    return np.column_stack([mean, variance[:, 1:4]]), accumulator["count"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time-averaged layer-by-layer polarization over a trajectory.")
+    parser.add_argument("trajectory_file", help="POSCAR / _HIST.poscar trajectory, or trajectory container")
+    parser.add_argument("reference_file", help="centrosymmetric reference structure (XV file)")
+    parser.add_argument("-o", "--output", default="PbTiO3.XV.P.mean.dat",
+                        help="output file (default: PbTiO3.XV.P.mean.dat)")
+    parser.add_argument("--skip", type=int, default=0, help="number of initial frames left out")
+    args = parser.parse_args()
+
+    statistics, number_of_frames = trajectory_statistics(args.trajectory_file, args.reference_file, skip=args.skip)
+
+    # Same first four columns as PbTiO3.XV.P.dat, then the variances
+    np.savetxt(args.output, statistics, fmt="%16.8f",
+               header=f"Averaged over {number_of_frames} frames\n"
+                      "Layer position (Ang)     Px (C/m^2)      Py (C/m^2)      Pz (C/m^2)"
+                      "     var(Px)         var(Py)         var(Pz)")
@@ -0,0 +1,218 @@
+"""
+A code to compare the layer-by-layer polarization profiles of the SIESTA
+and ABINIT runs of many configurations at once.
+
+The two codes do not need to put the layers at the same positions or
+indices: every profile is shifted so that its DW (the zero crossing of
+Pz nearest the middle of the supercell) is at x = 0, and all the
+profiles are linearly interpolated onto one shared grid, in one
+vectorized call for the whole batch. For each SIESTA/ABINIT pair and
+each component (Px, Py, Pz) the RMS and maximum deviations and the
+integrated difference (signed and absolute, in C/m^2 x Ang) over the
+grid are then computed and written as a summary table.
+
+Usage:
+    python profile_comparison.py "runs/*" -o profile_comparison.csv
+    python profile_comparison.py --pair PbTiO3.XV.P.dat results_pol_fullyrelaxed.dat
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from profile_loader import run_directories
+from structure_cache import load_polarization
+
+# Components of the profiles (columns 1, 2, 3 of PbTiO3.XV.P.dat)
+components = ["Px", "Py", "Pz"]
+
+# Statistics of the summary table, per component
+statistic_columns = ["rms", "max_abs", "integrated", "integrated_abs"]
+
+
+def _flatten(profiles):
+    # Ragged list of (L_m, 4) profiles -> one (sum L_m, 4) array sorted by
+    # profile then position, and the start of every profile in it
+    lengths = np.array([len(profile) for profile in profiles])
+    rows = np.repeat(np.arange(len(profiles)), lengths)
+    flat = np.concatenate([np.asarray(profile, dtype=float) for profile in profiles])
+    order = np.lexsort((flat[:, 0], rows))
+    starts = np.concatenate([[0], np.cumsum(lengths)])
+    return flat[order], rows[order], starts
+
+
+def dw_centers(profiles):
+    """
+    Position of the DW of every profile: the zero crossing of Pz (linearly
+    interpolated between layers) nearest the middle of the profile.
+
+    Returns:
+    (M,) DW positions (Ang)
+    """
+    flat, rows, starts = _flatten(profiles)
+    x, Pz = flat[:, 0], flat[:, 3]
+
+    # Sign changes of Pz between consecutive layers of the same profile
+    crossing = (rows[:-1] == rows[1:]) & (np.sign(Pz[:-1]) != np.sign(Pz[1:]))
+    i = np.flatnonzero(crossing)
+    x_crossing = x[i] - Pz[i] * (x[i + 1] - x[i]) / (Pz[i + 1] - Pz[i])
+
+    # Of every profile, the crossing nearest its middle
+    middle = (x[starts[:-1]] + x[starts[1:] - 1]) / 2
+    crossing_rows = rows[i]
+    order = np.lexsort((np.abs(x_crossing - middle[crossing_rows]), crossing_rows))
+    found, first = np.unique(crossing_rows[order], return_index=True)
+
+    centers = np.full(len(profiles), np.nan)
+    centers[found] = x_crossing[order][first]
+    if np.isnan(centers).any():
+        raise ValueError(f"No zero crossing of Pz in profile(s) {np.flatnonzero(np.isnan(centers)).tolist()}")
+    return centers
+
+
+def common_grid(profiles, shifts=None, spacing=None):
+    """
+    Grid shared by all the profiles: their common range (after the shifts
+    are subtracted), with the layer spacing of the first profile unless
+    spacing is given.
+    """
+    shifts = np.zeros(len(profiles)) if shifts is None else np.asarray(shifts, dtype=float)
+    low = max(np.min(profile[:, 0]) - shift for profile, shift in zip(profiles, shifts))
+    high = min(np.max(profile[:, 0]) - shift for profile, shift in zip(profiles, shifts))
+    if high <= low:
+        raise ValueError("The profiles have no common range of positions")
+    if spacing is None:
+        spacing = np.median(np.diff(np.sort(profiles[0][:, 0])))
+    return np.arange(low, high + 1.e-9 * spacing, spacing)
+
+
+def resample_profiles(profiles, grid, shifts=None):
+    """
+    Linear interpolation of all the profiles onto grid in one call.
+
+    The profiles are concatenated, each one offset along the position axis
+    so that the whole batch is one increasing sequence, and all the grid
+    points of all the profiles are located with a single searchsorted.
+
+    Parameters:
+    profiles : list of M (L_m, 4) arrays of position (Ang), Px, Py, Pz,
+               the numbers of layers L_m can differ
+    grid     : (G,) positions (Ang)
+    shifts   : (M,) positions subtracted from those of each profile first
+               (e.g. its DW center); default 0
+
+    Returns:
+    (M, G, 3) Px, Py, Pz on the grid, NaN outside the range of a profile
+    """
+    number_of_profiles = len(profiles)
+    shifts = np.zeros(number_of_profiles) if shifts is None else np.asarray(shifts, dtype=float)
+    flat, rows, starts = _flatten(profiles)
+    x = flat[:, 0] - shifts[rows]
+    grid = np.asarray(grid, dtype=float)
+
+    # Every profile gets its own band of the position axis
+    origin = min(x.min(), grid.min())
+    band = max(x.max(), grid.max()) - origin + 1.0
+    keys = rows * band + (x - origin)
+    queries = (np.arange(number_of_profiles)[:, None] * band + (grid - origin)).ravel()
+    query_rows = np.repeat(np.arange(number_of_profiles), len(grid))
+
+    first, last = starts[:-1][query_rows], starts[1:][query_rows] - 1
+    right = np.clip(np.searchsorted(keys, queries), first + 1, last)
+    left = right - 1
+    weight = ((queries - keys[left]) / (keys[right] - keys[left]))[:, None]
+    values = flat[left, 1:4] + weight * (flat[right, 1:4] - flat[left, 1:4])
+
+    outside = (queries < keys[first] - 1.e-9) | (queries > keys[last] + 1.e-9)
+    values[outside] = np.nan
+    return values.reshape(number_of_profiles, len(grid), 3)
+
+
+def compare_profiles(siesta_profiles, abinit_profiles, align=True, spacing=None):
+    """
+    Deviations between the SIESTA and ABINIT profiles of M runs, all the
+    profiles being resampled together onto one grid.
+
+    Parameters:
+    siesta_profiles, abinit_profiles : lists of M (L, 4) profiles, pairwise
+    align   : shift every profile so that its DW is at x = 0; otherwise the
+              positions are compared as they are
+    spacing : grid spacing (Ang) (default: layer spacing of the first profile)
+
+    Returns:
+    dictionary with the grid (G,), the resampled siesta and abinit profiles
+    (M, G, 3), their DW centers (M,) and, for every statistic of
+    statistic_columns, an (M, 3) array over Px, Py, Pz
+    """
+    if len(siesta_profiles) != len(abinit_profiles):
+        raise ValueError(f"{len(siesta_profiles)} SIESTA profiles but {len(abinit_profiles)} ABINIT profiles")
+    number_of_runs = len(siesta_profiles)
+    profiles = list(siesta_profiles) + list(abinit_profiles)
+
+    shifts = dw_centers(profiles) if align else np.zeros(len(profiles))
+    grid = common_grid(profiles, shifts, spacing)
+    resampled = resample_profiles(profiles, grid, shifts)
+    siesta, abinit = resampled[:number_of_runs], resampled[number_of_runs:]
+
+    difference = siesta - abinit
+    return {"grid": grid,
+            "siesta": siesta,
+            "abinit": abinit,
+            "siesta_centers": shifts[:number_of_runs],
+            "abinit_centers": shifts[number_of_runs:],
+            "rms": np.sqrt(np.mean(difference ** 2, axis=1)),
+            "max_abs": np.max(np.abs(difference), axis=1),
+            "integrated": np.trapezoid(difference, grid, axis=1),
+            "integrated_abs": np.trapezoid(np.abs(difference), grid, axis=1)}
+
+
+def write_summary(output, labels, comparison):
+    """
+    Write the summary table, one row per run and component, as CSV to
+    output (file name or open file).
+    """
+    text = "run,component," + ",".join(statistic_columns) + ",siesta_center,abinit_center\n"
+    for run, label in enumerate(labels):
+        for k, component in enumerate(components):
+            text += f"{label},{component}," + ",".join(f"{comparison[name][run, k]:.6e}"
+                                                      for name in statistic_columns)
+            text += f",{comparison['siesta_centers'][run]:.6f},{comparison['abinit_centers'][run]:.6f}\n"
+
+    if hasattr(output, "write"):
+        output.write(text)
+    else:
+        with open(output, 'w') as output_file:
+            output_file.write(text)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the SIESTA and ABINIT polarization profiles of many runs.")
+    parser.add_argument("runs", nargs="*", help="run directories or glob patterns holding both profiles")
+    parser.add_argument("--pair", nargs=2, action="append", default=[], metavar=("SIESTA", "ABINIT"),
+                        help="a SIESTA and an ABINIT profile file to compare (can be repeated)")
+    parser.add_argument("--siesta", default="PbTiO3.XV.P.dat",
+                        help="SIESTA profile in each run directory (default: PbTiO3.XV.P.dat)")
+    parser.add_argument("--abinit", default="results_pol_fullyrelaxed.dat",
+                        help="ABINIT profile in each run directory (default: results_pol_fullyrelaxed.dat)")
+    parser.add_argument("--no-align", action="store_true",
+                        help="compare the positions as they are instead of aligning the DW centers")
+    parser.add_argument("--spacing", type=float, default=None, help="grid spacing in Ang")
+    parser.add_argument("-o", "--output", default=None,
+                        help="CSV file for the summary (default: print to the terminal)")
+    args = parser.parse_args()
+
+    labels = [f"{siesta_file}|{abinit_file}" for siesta_file, abinit_file in args.pair]
+    pairs = list(args.pair)
+    if args.runs:
+        for directory in run_directories(args.runs, args.siesta):
+            if os.path.isfile(os.path.join(directory, args.abinit)):
+                labels.append(os.path.basename(os.path.normpath(directory)))
+                pairs.append((os.path.join(directory, args.siesta), os.path.join(directory, args.abinit)))
+    if not pairs:
+        sys.exit("No SIESTA/ABINIT profile pair found")
+
+    comparison = compare_profiles([np.asarray(load_polarization(siesta_file)) for siesta_file, _ in pairs],
+                                  [np.asarray(load_polarization(abinit_file)) for _, abinit_file in pairs],
+                                  align=not args.no_align, spacing=args.spacing)
+    write_summary(args.output or sys.stdout, labels, comparison)
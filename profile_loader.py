@@ -0,0 +1,67 @@
+#####################################################
+# Concurrent loading of the polarization profiles   #
+# (PbTiO3.XV.P.dat) of many run directories into    #
+# one (runs, layers, 4) array.                      #
+#####################################################
+import glob
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from structure_cache import load_polarization
+
+
+def _natural_key(text):
+    # "Bloch-10" after "Bloch-9"
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", text)]
+
+
+def run_directories(patterns, file_name="PbTiO3.XV.P.dat"):
+    """
+    Run directories matching the glob patterns that hold file_name, in
+    the order of the patterns and in natural order within each pattern.
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    directories = []
+    for pattern in patterns:
+        for directory in sorted(glob.glob(pattern), key=_natural_key):
+            if directory not in directories and os.path.isfile(os.path.join(directory, file_name)):
+                directories.append(directory)
+    return directories
+
+
+def load_profiles(patterns, file_name="PbTiO3.XV.P.dat", max_workers=None):
+    """
+    Read the profiles of all the run directories matching the glob
+    patterns in a thread pool, and stack them.
+
+    Parameters:
+    patterns    : glob pattern(s) of run directories, e.g. "*-Bloch*", or
+                  a list of directory names
+    file_name   : profile file in each run directory
+    max_workers : number of reader threads (default: ThreadPoolExecutor's)
+
+    Returns:
+    labels   : run labels (directory names), one per run
+    profiles : (runs, layers, 4) array of layer position (Ang), Px, Py, Pz
+    """
+    directories = run_directories(patterns, file_name)
+    if not directories:
+        raise FileNotFoundError(f"No run directory with {file_name} matches {patterns}")
+
+    # The loading is I/O bound (text parse on the first read, a memory-map
+    # from the cache afterwards), so threads overlap the file accesses
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        profiles = list(pool.map(lambda directory: load_polarization(os.path.join(directory, file_name)),
+                                 directories))
+
+    shapes = {profile.shape for profile in profiles}
+    if len(shapes) != 1:
+        details = ", ".join(f"{directory}: {profile.shape}" for directory, profile in zip(directories, profiles))
+        raise ValueError(f"The profiles do not all have the same number of layers ({details})")
+
+    labels = [os.path.basename(os.path.normpath(directory)) for directory in directories]
+    return labels, np.stack(profiles)
@@ -0,0 +1,251 @@
+#####################################################
+# Headless, parallel rendering of the profile       #
+# figures of polarization_profile.py,               #
+# plot_pol_profile.py, Bloch_minima_plot.py and     #
+# epsilon1_plot.py.txt.                             #
+#                                                   #
+# Figures are described by plain dictionaries       #
+# (specs) and rendered on the Agg backend in a      #
+# process pool. Each worker builds one figure and   #
+# reuses it: for every spec the lines are updated   #
+# with set_data instead of recreating the axes.     #
+#####################################################
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from instrumentation import timed
+
+# Figure of the current worker process, built on its first spec
+_figure = None
+
+
+def layer_labels(number_of_layers):
+    """
+    Alternating PbO / TiO2 tick labels.
+    """
+    return ["PbO" if layer % 2 == 0 else "TiO$_2$" for layer in range(number_of_layers)]
+
+
+def profile_spec(polarization_file, output, abinit_file=None, window=6, dpi=300):
+    """
+    Spec of the figure of polarization_profile.py / plot_pol_profile.py:
+    SIESTA Px, Py, Pz (solid), optionally ABINIT (dashed), with an inset
+    of Px around the DW.
+    """
+    from structure_cache import load_polarization
+
+    data = np.array(load_polarization(polarization_file))
+    x, Px, Py, Pz = data.T
+    labels = layer_labels(len(x))
+    CODW = int(len(x) / 2)  # center of DW
+
+    lines = [{"x": x, "y": Pz, "color": "red", "linestyle": "solid"},
+             {"x": x, "y": Px, "color": "green", "linestyle": "solid"},
+             {"x": x, "y": Py, "color": "blue", "linestyle": "solid"}]
+    inset_lines = [{"x": x[CODW - window:CODW + window], "y": Px[CODW - window:CODW + window],
+                    "color": "green", "linestyle": "solid"}]
+
+    if abinit_file is not None:
+        abinit = np.array(load_polarization(abinit_file))
+        lines += [{"x": abinit[:, 0], "y": abinit[:, 3], "color": "red", "linestyle": "dashed"},
+                  {"x": abinit[:, 0], "y": abinit[:, 1], "color": "green", "linestyle": "dashed"},
+                  {"x": abinit[:, 0], "y": abinit[:, 2], "color": "blue", "linestyle": "dashed"}]
+        # ABINIT layers within the SIESTA window by position, not by index
+        inset = ((abinit[:, 0] > (x[CODW - window - 1] + x[CODW - window]) / 2)
+                 & (abinit[:, 0] < (x[CODW + window - 1] + x[CODW + window]) / 2))
+        inset_lines.append({"x": abinit[inset, 0], "y": abinit[inset, 1],
+                            "color": "green", "linestyle": "dashed"})
+
+    return {"output": output, "dpi": dpi, "lines": lines,
+            "ylabel": "P$_z$", "xticks": x, "xticklabels": labels,
+            "xlim": (x[0] - 1, x[-1] + 1), "ylim": (np.min(Pz) - 0.1, np.max(Pz) + 0.1),
+            "vline": x[CODW], "text": (x[0], np.max(Pz), "(a)"),
+            "inset": {"lines": inset_lines,
+                      "xticks": x[CODW - window:CODW + window],
+                      "xticklabels": labels[CODW - window:CODW + window],
+                      "xlim": (x[CODW - window] - 1, x[CODW + window]),
+                      "ylim": (np.min(Px) - 0.0015, np.max(Px) + 0.0015),
+                      "vline": x[CODW]}}
+
+
+def bloch_spec(labels, profiles, output, dpi=300):
+    """
+    Spec of the figure of Bloch_minima_plot.py: Py of several runs, from
+    profile_loader.load_profiles.
+    """
+    colors = ['k', 'c', 'm', 'orange']
+    x, Py = profiles[:, :, 0], profiles[:, :, 2]
+    return {"output": output, "dpi": dpi,
+            "lines": [{"x": x[run], "y": Py[run], "color": colors[run % len(colors)],
+                       "linestyle": "solid", "label": label} for run, label in enumerate(labels)],
+            "ylabel": "P$_y$", "xticks": x[0], "xticklabels": layer_labels(x.shape[1]),
+            "xlim": (x[-1, 0] - 1, x[-1, -1] + 1), "ylim": (np.min(Py) - 0.05, np.max(Py) + 0.05),
+            "legend": True}
+
+
+def epsilon1_spec(PbO_positions, curves, output, dpi=300):
+    """
+    Spec of the figure of epsilon1_plot.py.txt: epsilon_1 of every PbO
+    plane for the variants in curves, {"noPxnoPy": eps, "noPy": eps, "PxPyPz": eps}.
+    """
+    colors = {"noPxnoPy": "r", "noPy": "g", "PxPyPz": "b"}
+    return {"output": output, "dpi": dpi,
+            "lines": [{"x": PbO_positions, "y": epsilon1, "color": colors.get(name), "linestyle": "solid",
+                       "label": name} for name, epsilon1 in curves.items()],
+            "ylabel": r'$\mathrm{\epsilon_{1}}$', "xticks": PbO_positions,
+            "xticklabels": ["PbO"] * len(PbO_positions),
+            "xlim": (PbO_positions[0] - 2, PbO_positions[-1] + 2)}
+
+
+def _new_figure():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.axes_grid1.inset_locator import inset_axes
+
+    plt.rcParams["font.family"] = "Times New Roman" # Apply Times New Roman font
+    fig, ax = plt.subplots(1, 1, figsize=(8, 6), constrained_layout=True)
+    inset_ax = inset_axes(ax, width="38%", height="30%", loc="upper right", borderpad=0.5)
+    ax.tick_params(axis='both', labelsize=14)
+    inset_ax.tick_params(axis='both', labelsize=12)
+
+    return {"figure": fig,
+            "axes": {"main": ax, "inset": inset_ax},
+            "lines": {"main": [], "inset": []},
+            "vlines": {name: axes.axvline(x=0, color='black', linestyle='-.', visible=False)
+                       for name, axes in [("main", ax), ("inset", inset_ax)]},
+            "text": ax.text(0, 0, "", fontsize=14)}
+
+
+def _update_axes(figure, name, spec):
+    """
+    Update the lines, ticks, limits and DW line of one of the axes of the
+    worker figure to spec. Missing lines are added, unused ones hidden.
+    """
+    axes = figure["axes"][name]
+    lines = figure["lines"][name]
+    for _ in range(len(spec["lines"]) - len(lines)):
+        lines.append(axes.plot([], [])[0])
+
+    for line, line_spec in zip(lines, spec["lines"]):
+        line.set_data(line_spec["x"], line_spec["y"])
+        line.set_color(line_spec.get("color") or "black")
+        line.set_linestyle(line_spec.get("linestyle", "solid"))
+        line.set_label(line_spec.get("label", "_nolegend_"))
+        line.set_visible(True)
+    for line in lines[len(spec["lines"]):]:
+        line.set_visible(False)
+        line.set_label("_nolegend_")
+
+    axes.set_xticks(spec.get("xticks", []))
+    axes.set_xticklabels(spec.get("xticklabels", []), rotation=90)
+
+    vline = figure["vlines"][name]
+    vline.set_visible(spec.get("vline") is not None)
+    if spec.get("vline") is not None:
+        vline.set_xdata([spec["vline"], spec["vline"]])
+
+    # set_xlim / set_ylim of an earlier spec switch autoscaling off, so it is
+    # switched back on before the limits of this spec are worked out
+    axes.set_autoscalex_on(True)
+    axes.set_autoscaley_on(True)
+    axes.relim(visible_only=True)
+    axes.autoscale_view()
+    if "xlim" in spec:
+        axes.set_xlim(spec["xlim"])
+    if "ylim" in spec:
+        axes.set_ylim(spec["ylim"])
+
+
+@timed("render")
+def render(spec):
+    """
+    Render one figure spec to its output file with the figure of the
+    current process, building the figure on the first call.
+
+    Returns:
+    the output file
+    """
+    global _figure
+    if _figure is None:
+        _figure = _new_figure()
+    figure = _figure
+
+    _update_axes(figure, "main", spec)
+    main_axes = figure["axes"]["main"]
+    main_axes.set_ylabel(spec.get("ylabel", ""), fontsize=16)
+
+    legend = main_axes.get_legend()
+    if legend is not None:
+        legend.remove()
+    if spec.get("legend"):
+        main_axes.legend(fontsize=12)
+
+    text = spec.get("text")
+    figure["text"].set_visible(text is not None)
+    if text is not None:
+        figure["text"].set_position(text[0:2])
+        figure["text"].set_text(text[2])
+
+    inset_axes = figure["axes"]["inset"]
+    inset_axes.set_visible("inset" in spec)
+    if "inset" in spec:
+        _update_axes(figure, "inset", spec["inset"])
+
+    figure["figure"].savefig(spec["output"], dpi=spec.get("dpi", 300))
+    return spec["output"]
+
+
+def run_profile_specs(polarization_files, abinit_name=None, output_name="pol_profile.png", dpi=300):
+    """
+    Specs of the polarization profile figures of many runs, as rendered by
+    this script and by "dw.py plot": each figure is written to output_name
+    in the directory of its profile, with the ABINIT profile abinit_name of
+    that directory in the inset if given.
+    """
+    specs = []
+    for polarization_file in polarization_files:
+        directory = os.path.dirname(polarization_file)
+        abinit_file = os.path.join(directory, abinit_name) if abinit_name else None
+        specs.append(profile_spec(polarization_file, os.path.join(directory, output_name), abinit_file, dpi=dpi))
+    return specs
+
+
+@timed("render_many")
+def render_many(specs, processes=None):
+    """
+    Render many figure specs in a process pool, one reused figure per
+    worker process.
+
+    Returns:
+    list of the output files
+    """
+    specs = list(specs)
+    if processes == 1 or len(specs) == 1:
+        return [render(spec) for spec in specs]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(render, specs, chunksize=max(1, len(specs) // (4 * (processes or os.cpu_count() or 1)))))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the polarization profile figure of many runs, headless.")
+    parser.add_argument("polarization_files", nargs="+", help="PbTiO3.XV.P.dat files, one per run")
+    parser.add_argument("--abinit", default=None,
+                        help="name of the ABINIT profile in each run directory, e.g. results_pol_fullyrelaxed.dat")
+    parser.add_argument("-o", "--output-name", default="pol_profile.png",
+                        help="name of the PNG written in each run directory (default: pol_profile.png)")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    args = parser.parse_args()
+
+    specs = run_profile_specs(args.polarization_files, args.abinit, args.output_name, args.dpi)
+
+    start = time.perf_counter()
+    outputs = render_many(specs, args.processes)
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {len(outputs)} figure(s) in {elapsed:.2f} s ({len(outputs) / elapsed:.1f} figures/s)")
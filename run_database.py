@@ -0,0 +1,228 @@
+"""
+SQLite store of the DW runs: energies, lattice parameters, fitted widths
+and layer-by-layer polarization profiles.
+
+One row of the runs table per substrate x wall type x code, indexed on
+substrate, wall, code and misfit strain, so that queries such as "all
+Bloch walls under compressive strain" are answered from the indexes.
+Polarization profiles (the PbTiO3.XV.P.dat columns) are stored as
+float64 blobs in the profiles table.
+
+Usage:
+    python run_database.py import dw_configurations.csv
+    python run_database.py add-profile fully_relaxed/Ising+Neel+Bloch/SIESTA PbTiO3.XV.P.dat
+    python run_database.py query --wall Ising+Neel+Bloch --strain compressive
+"""
+import argparse
+import sqlite3
+
+import numpy as np
+
+from units import a_reference
+
+# Default database file
+database_file = "dw_runs.sqlite"
+
+schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_name         TEXT PRIMARY KEY,
+    substrate        TEXT NOT NULL,
+    wall             TEXT NOT NULL,
+    code             TEXT NOT NULL,
+    number_uc        INTEGER,
+    energy_tetra     REAL,
+    energy_supercell REAL,
+    lattice_b        REAL,
+    lattice_c        REAL,
+    misfit_strain    REAL,
+    dw_energy_eV_per_uc      REAL,
+    dw_energy_mJ_per_m2      REAL,
+    dw_energy_meV_per_square REAL,
+    Po               REAL,
+    delta            REAL,
+    x0               REAL
+);
+CREATE INDEX IF NOT EXISTS runs_substrate ON runs (substrate);
+CREATE INDEX IF NOT EXISTS runs_wall ON runs (wall);
+CREATE INDEX IF NOT EXISTS runs_code ON runs (code);
+CREATE INDEX IF NOT EXISTS runs_wall_strain ON runs (wall, misfit_strain);
+
+CREATE TABLE IF NOT EXISTS profiles (
+    run_name TEXT PRIMARY KEY REFERENCES runs (run_name) ON DELETE CASCADE,
+    layers   INTEGER NOT NULL,
+    columns  INTEGER NOT NULL,
+    data     BLOB NOT NULL
+);
+"""
+
+# Columns of the runs table that can be set by add_run
+run_columns = ["substrate", "wall", "code", "number_uc", "energy_tetra", "energy_supercell",
+               "lattice_b", "lattice_c", "misfit_strain", "dw_energy_eV_per_uc",
+               "dw_energy_mJ_per_m2", "dw_energy_meV_per_square", "Po", "delta", "x0"]
+
+
+def open_database(file_name=database_file):
+    """
+    Open (and create if needed) the run database.
+    """
+    connection = sqlite3.connect(file_name)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(schema)
+    return connection
+
+
+def run_name_of(substrate, wall, code):
+    """
+    Name of the run of a substrate, wall type and code, e.g.
+    "SrTiO3/Ising+Neel+Bloch/SIESTA".
+    """
+    return f"{substrate}/{wall}/{code}"
+
+
+def add_run(connection, run_name, **values):
+    """
+    Insert a run, or update the given columns of an existing one.
+
+    The misfit strain is worked out from lattice_b if it is not given.
+    """
+    unknown = set(values) - set(run_columns)
+    if unknown:
+        raise ValueError(f"Unknown run column(s): {', '.join(sorted(unknown))}")
+
+    if "lattice_b" in values and "misfit_strain" not in values:
+        values["misfit_strain"] = (values["lattice_b"] - a_reference) / a_reference
+
+    names = list(values)
+    with connection:
+        connection.execute(
+            f"INSERT INTO runs (run_name, {', '.join(names)}) VALUES (?{', ?' * len(names)}) "
+            f"ON CONFLICT (run_name) DO UPDATE SET {', '.join(f'{name} = excluded.{name}' for name in names)}",
+            [run_name] + [_sql_value(values[name]) for name in names])
+
+
+def _sql_value(value):
+    # NumPy scalars are stored as plain Python numbers and strings
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def import_configurations(connection, configurations, energies):
+    """
+    Store the configurations and DW energies of dw_energy_table.py
+    (read_configurations / dw_energies), one run per row.
+
+    Returns:
+    names of the runs
+    """
+    run_names = []
+    with connection:
+        for row, configuration in enumerate(configurations):
+            run_name = run_name_of(configuration["substrate"], configuration["wall"], configuration["code"])
+            values = {name: configuration[name] for name in configurations.dtype.names}
+            values.update({name: energies[name][row] for name in
+                           ["dw_energy_eV_per_uc", "dw_energy_mJ_per_m2", "dw_energy_meV_per_square"]})
+            add_run(connection, run_name, **values)
+            run_names.append(run_name)
+    return run_names
+
+
+def set_width(connection, run_name, Po, delta, x0):
+    """
+    Store the fitted tanh parameters of the polarization profile of a run.
+    """
+    with connection:
+        updated = connection.execute("UPDATE runs SET Po = ?, delta = ?, x0 = ? WHERE run_name = ?",
+                                     (float(Po), float(delta), float(x0), run_name)).rowcount
+    if not updated:
+        raise KeyError(f"No run named {run_name}")
+
+
+def add_profile(connection, run_name, profile):
+    """
+    Store the layer-by-layer polarization profile (layers x columns,
+    e.g. position, Px, Py, Pz) of a run as a float64 blob.
+    """
+    profile = np.ascontiguousarray(profile, dtype=np.float64)
+    if profile.ndim != 2:
+        raise ValueError("profile must be a (layers, columns) array")
+
+    with connection:
+        connection.execute("INSERT OR REPLACE INTO profiles (run_name, layers, columns, data) VALUES (?, ?, ?, ?)",
+                           (run_name, profile.shape[0], profile.shape[1], profile.tobytes()))
+
+
+def load_profile(connection, run_name):
+    """
+    Layer-by-layer polarization profile of a run, as stored by add_profile.
+    """
+    row = connection.execute("SELECT layers, columns, data FROM profiles WHERE run_name = ?",
+                             (run_name,)).fetchone()
+    if row is None:
+        raise KeyError(f"No profile stored for {run_name}")
+    return np.frombuffer(row["data"], dtype=np.float64).reshape(row["layers"], row["columns"])
+
+
+def query_runs(connection, substrate=None, wall=None, code=None, strain=None):
+    """
+    Runs matching all the given criteria.
+
+    Parameters:
+    substrate, wall, code : exact values, e.g. wall="Ising+Neel+Bloch"
+    strain                : "compressive" (misfit strain < 0), "tensile" (> 0)
+                            or "none" (= 0), relative to a_reference
+
+    Returns:
+    list of sqlite3.Row, ordered by substrate, wall and code
+    """
+    conditions, parameters = [], []
+    for name, value in [("substrate", substrate), ("wall", wall), ("code", code)]:
+        if value is not None:
+            conditions.append(f"{name} = ?")
+            parameters.append(value)
+
+    strain_conditions = {"compressive": "misfit_strain < 0", "tensile": "misfit_strain > 0",
+                         "none": "misfit_strain = 0"}
+    if strain is not None:
+        if strain not in strain_conditions:
+            raise ValueError(f"strain must be one of {', '.join(strain_conditions)}")
+        conditions.append(strain_conditions[strain])
+
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return connection.execute(f"SELECT * FROM runs{where} ORDER BY substrate, wall, code", parameters).fetchall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite store of the DW runs.")
+    parser.add_argument("--database", default=database_file, help=f"database file (default: {database_file})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="import a table of configurations (dw_energy_table.py)")
+    import_parser.add_argument("configurations")
+
+    profile_parser = commands.add_parser("add-profile", help="store the polarization profile of a run")
+    profile_parser.add_argument("run_name")
+    profile_parser.add_argument("profile_file", help="e.g. PbTiO3.XV.P.dat")
+
+    query_parser = commands.add_parser("query", help="list the runs matching the criteria")
+    query_parser.add_argument("--substrate")
+    query_parser.add_argument("--wall")
+    query_parser.add_argument("--code")
+    query_parser.add_argument("--strain", choices=["compressive", "tensile", "none"])
+
+    args = parser.parse_args()
+    connection = open_database(args.database)
+
+    if args.command == "import":
+        from dw_energy_table import dw_energies, read_configurations
+
+        configurations = read_configurations(args.configurations)
+        run_names = import_configurations(connection, configurations, dw_energies(configurations))
+        print(f"Imported {len(run_names)} run(s) into {args.database}")
+
+    elif args.command == "add-profile":
+        add_profile(connection, args.run_name, np.loadtxt(args.profile_file, comments="#", ndmin=2))
+
+    elif args.command == "query":
+        for run in query_runs(connection, args.substrate, args.wall, args.code, args.strain):
+            print(f"{run['run_name']:<50} b = {run['lattice_b']:.6f} Ang  strain = {run['misfit_strain']:+.4%}  "
+                  f"E_DW = {run['dw_energy_mJ_per_m2']:.3f} mJ/m^2")
@@ -0,0 +1,208 @@
+#####################################################
+# PbO-plane positions and local strain epsilon_1    #
+# of every PbO plane of an N x 1 x 1 PbTiO3 DW      #
+# supercell, from POSCAR / _HIST.poscar / XV files. #
+#                                                   #
+# Writes the PbO_positions.dat and                  #
+# Relax_cell-noPxnoPy.dat, RelaxCell-noPy.dat,      #
+# Relax_cell.dat files read by epsilon1_plot.py.txt #
+#####################################################
+#
+# The PbO planes are the layers perpendicular to the first lattice vector
+# (the DW normal) that hold Pb atoms. The position of a plane is the mean
+# position of its atoms along the normal, and the local lattice parameter
+# at a plane is half the distance between its two neighbouring PbO planes
+# (periodic supercell), so that
+#
+#     epsilon_1 = (x_{i+1} - x_{i-1}) / 2 / a_reference - 1
+#
+# All the structures (the variants noPxnoPy, noPy, PxPyPz, or the frames
+# of a trajectory) are stacked in one (F, N, 3) batch, and the atoms are
+# assigned to planes and averaged with np.bincount, without a loop over
+# the atoms or the frames.
+import argparse
+import os
+
+import numpy as np
+
+from POSCAR2XV import read_poscar_frames, read_XV, species_arrays
+from polarization_engine import layers_per_cell, supercell_repetitions
+from units import a_reference, bohr_in_Ang
+
+# Pb, whose layers are the PbO planes
+Pb_atomic_number = 82
+
+# Relaxations of epsilon1_plot.py.txt and the files it reads
+variant_files = {"noPxnoPy": "Relax_cell-noPxnoPy.dat",
+                 "noPy": "RelaxCell-noPy.dat",
+                 "PxPyPz": "Relax_cell.dat"}
+positions_file = "PbO_positions.dat"
+
+
+def read_structure_frames(file_name, all_frames=False):
+    """
+    Fractional coordinates, lattice vectors and atomic numbers of a POSCAR,
+    _HIST.poscar or XV file, or of a trajectory container.
+
+    Parameters:
+    file_name  : structure file; names ending in .XV are read as XV files,
+                 directories as trajectory containers (trajectory_store.py)
+    all_frames : every frame of a trajectory instead of the last one only
+
+    Returns:
+    fractional coordinates (F, N, 3), lattice vectors (F, 3, 3) in Ang,
+    atomic numbers (N,)
+    """
+    if os.path.isdir(file_name):
+        from trajectory_store import open_trajectory, read_frames
+
+        trajectory = open_trajectory(file_name)
+        fractional, lattice_vectors = read_frames(trajectory, 0 if all_frames else -1)
+        return np.asarray(fractional, dtype=float), np.asarray(lattice_vectors), trajectory["atomic_numbers"]
+
+    if file_name.upper().endswith(".XV"):
+        structure = read_XV(file_name)
+        lattice_vectors = structure["lattice_vectors"] * bohr_in_Ang
+        fractional = structure["coordinates"] * bohr_in_Ang @ np.linalg.inv(lattice_vectors)
+        return fractional[None], lattice_vectors[None], structure["atomic_numbers"]
+
+    fractional, lattice_vectors = [], []
+    for frame in read_poscar_frames(file_name):
+        if not all_frames:
+            fractional, lattice_vectors = [], []
+        fractional.append(frame["coordinates"])
+        lattice_vectors.append(frame["lattice_vectors"] * frame["scaling_factor"])
+    if not fractional:
+        raise ValueError(f"No POSCAR frame found in {file_name}")
+
+    _, atomic_numbers = species_arrays(frame["species_names"], frame["species_counts"])
+    return np.stack(fractional), np.stack(lattice_vectors), atomic_numbers
+
+
+def PbO_plane_positions(fractional, lattice_vectors, atomic_numbers, number_of_layers=None):
+    """
+    Position along the DW normal of every PbO plane of every structure.
+
+    The atoms are assigned to layers from the first structure, so that a
+    plane keeps its atoms in all the structures of the batch.
+
+    Parameters:
+    fractional       : (F, N, 3) fractional coordinates
+    lattice_vectors  : (F, 3, 3) lattice vectors (Ang), one per row
+    atomic_numbers   : (N,) atomic numbers
+    number_of_layers : PbO + TiO2 layers along the first lattice vector
+                       (default: two per unit cell)
+
+    Returns:
+    (F, P) positions of the P PbO planes (Ang), in the order of the planes
+    """
+    number_of_frames, number_of_atoms, _ = fractional.shape
+    if number_of_layers is None:
+        number_of_layers = layers_per_cell * supercell_repetitions(lattice_vectors[0], number_of_atoms)[0]
+
+    # Layer of every atom, and the PbO layers: those holding Pb
+    layer_coordinate = fractional[:, :, 0] * number_of_layers
+    layer = np.rint(layer_coordinate[0]).astype(int) % number_of_layers
+    is_PbO_layer = np.bincount(layer[atomic_numbers == Pb_atomic_number], minlength=number_of_layers) > 0
+    in_PbO_plane = is_PbO_layer[layer]
+    plane_of_layer = np.cumsum(is_PbO_layer) - 1
+    number_of_planes = int(is_PbO_layer.sum())
+
+    # Offset of every atom from its layer (minimum image), in layer units
+    offset = layer_coordinate - layer
+    offset -= np.rint(offset)
+
+    # Mean offset of the atoms of every plane of every frame, in one bincount
+    index = (np.arange(number_of_frames)[:, None] * number_of_planes + plane_of_layer[layer])[:, in_PbO_plane]
+    sums = np.bincount(index.ravel(), weights=offset[:, in_PbO_plane].ravel(),
+                       minlength=number_of_frames * number_of_planes)
+    counts = np.bincount(plane_of_layer[layer][in_PbO_plane], minlength=number_of_planes)
+    mean_offset = sums.reshape(number_of_frames, number_of_planes) / counts
+
+    a_length = np.linalg.norm(lattice_vectors[:, 0], axis=1)
+    return (np.flatnonzero(is_PbO_layer) + mean_offset) * (a_length / number_of_layers)[:, None]
+
+
+def epsilon1(plane_positions, a_length, a_reference=a_reference):
+    """
+    Local strain along the DW normal at every PbO plane, from the
+    distance between its two neighbouring planes (periodic supercell).
+
+    Parameters:
+    plane_positions : (F, P) PbO plane positions (Ang)
+    a_length        : (F,) supercell length along the DW normal (Ang)
+    a_reference     : unstrained lattice parameter (Ang)
+
+    Returns:
+    (F, P) epsilon_1
+    """
+    a_length = np.asarray(a_length, dtype=float)[:, None]
+    next_plane = np.roll(plane_positions, -1, axis=1)
+    next_plane[:, -1] += a_length[:, 0]
+    previous_plane = np.roll(plane_positions, 1, axis=1)
+    previous_plane[:, 0] -= a_length[:, 0]
+    return (next_plane - previous_plane) / 2 / a_reference - 1
+
+
+def epsilon1_of_structures(structure_files, all_frames=False, a_reference=a_reference):
+    """
+    PbO-plane positions and epsilon_1 of several structures at once, e.g.
+    {"noPxnoPy": ..., "noPy": ..., "PxPyPz": ...}, all with the same atoms
+    in the same order.
+
+    Returns:
+    positions : {name: (F, P) PbO plane positions (Ang)}
+    strains   : {name: (F, P) epsilon_1}
+    with F = 1 unless all_frames
+    """
+    names, fractional, lattice_vectors, frames_of = [], [], [], []
+    atomic_numbers = None
+    for name, file_name in structure_files.items():
+        structure_fractional, structure_lattice, structure_numbers = read_structure_frames(file_name, all_frames)
+        if atomic_numbers is None:
+            atomic_numbers = structure_numbers
+        elif not np.array_equal(atomic_numbers, structure_numbers):
+            raise ValueError(f"{file_name} does not have the same atoms in the same order as the first structure")
+        names.append(name)
+        fractional.append(structure_fractional)
+        lattice_vectors.append(structure_lattice)
+        frames_of.append(len(structure_fractional))
+
+    # One batch of all the frames of all the structures
+    fractional = np.concatenate(fractional)
+    lattice_vectors = np.concatenate(lattice_vectors)
+    positions = PbO_plane_positions(fractional, lattice_vectors, atomic_numbers)
+    strains = epsilon1(positions, np.linalg.norm(lattice_vectors[:, 0], axis=1), a_reference)
+
+    bounds = np.cumsum([0] + frames_of)
+    return ({name: positions[start:end] for name, start, end in zip(names, bounds[:-1], bounds[1:])},
+            {name: strains[start:end] for name, start, end in zip(names, bounds[:-1], bounds[1:])})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PbO-plane positions and epsilon_1 from structure files.")
+    parser.add_argument("structures", nargs="+", metavar="NAME=FILE",
+                        help="structures as name=file, e.g. noPxnoPy=noPxnoPy/PbTiO3.XV noPy=... PxPyPz=...; "
+                             "POSCAR, _HIST.poscar or .XV files")
+    parser.add_argument("--all-frames", action="store_true",
+                        help="every frame of the trajectories, one row per frame in <name>.epsilon1.dat")
+    parser.add_argument("--a-reference", type=float, default=a_reference,
+                        help=f"unstrained lattice parameter in Ang (default: {a_reference})")
+    args = parser.parse_args()
+
+    structure_files = dict(structure.split("=", 1) for structure in args.structures)
+    positions, strains = epsilon1_of_structures(structure_files, args.all_frames, args.a_reference)
+
+    if args.all_frames:
+        for name in structure_files:
+            np.savetxt(f"{name}.epsilon1.dat", strains[name], fmt="%14.8f",
+                       header="epsilon_1 of every PbO plane (columns), one frame per row")
+            np.savetxt(f"{name}.PbO_positions.dat", positions[name], fmt="%14.8f",
+                       header="PbO plane positions (Ang), one frame per row")
+    else:
+        # The files of epsilon1_plot.py.txt: one value per line, the plane
+        # positions of the first structure on the x axis
+        first = next(iter(structure_files))
+        np.savetxt(positions_file, positions[first][0], fmt="%14.8f")
+        for name in structure_files:
+            np.savetxt(variant_files.get(name, f"{name}.dat"), strains[name][0], fmt="%14.8f")
@@ -0,0 +1,173 @@
+#####################################################
+# Binary cache for parsed structures and            #
+# polarization tables.                              #
+#                                                   #
+# Parsed arrays are stored as .npy sidecar files in #
+# a .dw_cache directory next to the source file and #
+# loaded back memory-mapped. They are keyed by the  #
+# SHA-256 of the source file and rebuilt only when  #
+# its content changes.                              #
+#####################################################
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from instrumentation import timed
+
+# Name of the cache directory created next to the source files. Set the
+# DW_CACHE_DIR environment variable to keep all the caches in one place.
+CACHE_DIR_NAME = ".dw_cache"
+
+
+def cache_directory(file_name):
+    """
+    Cache directory for file_name.
+    """
+    return os.environ.get("DW_CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(file_name)), CACHE_DIR_NAME)
+
+
+def file_hash(file_name, chunk_size=1 << 20):
+    """
+    SHA-256 of the content of file_name, read in chunks of 1 MB.
+    """
+    sha256 = hashlib.sha256()
+    with open(file_name, 'rb') as source_file:
+        for chunk in iter(lambda: source_file.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def source_key(file_name):
+    """
+    Name of the cache files of file_name: its base name and a hash of its
+    absolute path, so that the PbTiO3.XV.P.dat of every run directory gets
+    its own stamp and entries in a shared DW_CACHE_DIR.
+    """
+    path_hash = hashlib.sha256(os.path.abspath(file_name).encode()).hexdigest()[:12]
+    return f"{os.path.basename(file_name)}-{path_hash}"
+
+
+def source_hash(file_name):
+    """
+    SHA-256 of file_name, re-computed only when its size or mtime changed.
+
+    The last hash is kept in a small .stamp.json file in the cache
+    directory together with the size and mtime it was computed for, so an
+    unchanged file costs a stat() instead of being read again.
+    """
+    stat = os.stat(file_name)
+    stamp_file = os.path.join(cache_directory(file_name), source_key(file_name) + ".stamp.json")
+
+    try:
+        with open(stamp_file, 'r') as stamp_handle:
+            stamp = json.load(stamp_handle)
+        if stamp["size"] == stat.st_size and stamp["mtime_ns"] == stat.st_mtime_ns:
+            return stamp["sha256"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    sha256 = file_hash(file_name)
+
+    os.makedirs(os.path.dirname(stamp_file), exist_ok=True)
+    with open(stamp_file, 'w') as stamp_handle:
+        json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}, stamp_handle)
+
+    return sha256
+
+
+def cached_arrays(file_name, kind, build):
+    """
+    Arrays parsed from file_name, loaded from the cache if file_name has
+    not changed since they were built.
+
+    Parameters:
+    file_name : source text file
+    kind      : name of the parsed content, e.g. "loadtxt" or "poscar",
+                so that different parsers of one file get different entries
+    build     : function build(file_name) returning a dictionary of arrays,
+                called only when the cache is missing or out of date
+
+    Returns:
+    dictionary of read-only arrays, memory-mapped from the .npy files
+    """
+    sha256 = source_hash(file_name)
+    prefix = f"{source_key(file_name)}.{kind}."
+    directory = cache_directory(file_name)
+    entry = os.path.join(directory, prefix + sha256[:16])
+
+    if not os.path.isdir(entry):
+        arrays = build(file_name)
+
+        # Build the entry in a temporary directory and move it in place,
+        # so that a concurrent reader never sees a half-written entry
+        os.makedirs(directory, exist_ok=True)
+        tmp_entry = tempfile.mkdtemp(dir=directory, prefix=".tmp-")
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_entry, name + ".npy"), np.asarray(array), allow_pickle=False)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Another process built the same entry first
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+
+        # Remove the entries built for older versions of this file (the
+        # prefix holds the hash of its absolute path, so the entries of
+        # same-named files of other directories are kept)
+        for old_entry in os.listdir(directory):
+            if old_entry.startswith(prefix) and old_entry != os.path.basename(entry):
+                shutil.rmtree(os.path.join(directory, old_entry), ignore_errors=True)
+
+    return {name[:-len(".npy")]: np.load(os.path.join(entry, name), mmap_mode='r', allow_pickle=False)
+            for name in sorted(os.listdir(entry)) if name.endswith(".npy")}
+
+
+@timed("load")
+def cached_loadtxt(file_name, **loadtxt_kwargs):
+    """
+    np.loadtxt(file_name, **loadtxt_kwargs) through the cache.
+    """
+    kind = "loadtxt"
+    if loadtxt_kwargs:
+        # Different loadtxt arguments give different arrays
+        kind += "-" + hashlib.sha256(repr(sorted(loadtxt_kwargs.items())).encode()).hexdigest()[:8]
+
+    return cached_arrays(file_name, kind,
+                         lambda source: {"data": np.loadtxt(source, **loadtxt_kwargs)})["data"]
+
+
+def load_polarization(file_name="PbTiO3.XV.P.dat"):
+    """
+    Layer-by-layer polarization table (position, Px, Py, Pz), as read by
+    np.loadtxt(file_name, comments="#"), through the cache.
+    """
+    return cached_loadtxt(file_name, comments="#")
+
+
+def _build_poscar(file_name):
+    # Imported here since POSCAR2XV itself reads through this cache
+    from POSCAR2XV import last_poscar_frame
+
+    frame = last_poscar_frame(file_name)
+    return {"scaling_factor": np.float64(frame["scaling_factor"]),
+            "lattice_vectors": frame["lattice_vectors"],
+            "species_names": np.array(frame["species_names"], dtype=str),
+            "species_counts": np.array(frame["species_counts"], dtype=np.int64),
+            "coordinates": frame["coordinates"]}
+
+
+@timed("load")
+def load_poscar_frame(file_name):
+    """
+    Last frame of a POSCAR or _HIST.poscar file through the cache, as the
+    dictionary returned by POSCAR2XV.read_poscar_frames.
+    """
+    arrays = cached_arrays(file_name, "poscar", _build_poscar)
+    return {"scaling_factor": float(arrays["scaling_factor"]),
+            "lattice_vectors": np.array(arrays["lattice_vectors"]),
+            "species_names": arrays["species_names"].tolist(),
+            "species_counts": arrays["species_counts"].tolist(),
+            "coordinates": arrays["coordinates"]}
@@ -0,0 +1,236 @@
+#####################################################
+# Binary container for long relaxation / MD         #
+# histories: a directory of .npy files written      #
+# chunk by chunk from a _HIST.poscar trajectory.    #
+#                                                   #
+#   PbTiO3.dwtraj/                                  #
+#       meta.json            frames, atoms, dtype,  #
+#                            species, chunk sizes   #
+#       atomic_numbers.npy   (N,)                   #
+#       species.npy          (N,) species index     #
+#       lattice_vectors.npy  (F, 3, 3) Ang          #
+#       chunk_00000.npy      (<= C, N, 3) fractional#
+#       chunk_00001.npy      coordinates, float32   #
+#       ...                  or float64             #
+#                                                   #
+# The chunks are memory-mapped, so a range of       #
+# frames inside one chunk is a view on the file     #
+# (no copy, no parse). With compressed=True the     #
+# chunks are zlib-compressed .npz files instead,    #
+# decompressed one chunk at a time when read.       #
+# Text XV files for SIESTA restarts are still       #
+# written from any frame with export_XV.            #
+#####################################################
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from POSCAR2XV import read_poscar_frames, species_arrays, write_to_XV
+from instrumentation import timed
+
+# Frames per chunk
+chunk_frames = 256
+
+meta_file_name = "meta.json"
+
+
+def _chunk_file(directory, chunk, compressed):
+    return os.path.join(directory, f"chunk_{chunk:05d}.{'npz' if compressed else 'npy'}")
+
+
+@timed("write")
+def write_trajectory(poscar_file, directory, dtype="float64", frames_per_chunk=chunk_frames, compressed=False):
+    """
+    Write all the frames of a POSCAR / _HIST.poscar file to a trajectory
+    container, streaming one chunk of frames at a time.
+
+    Parameters:
+    poscar_file      : POSCAR or _HIST.poscar file
+    directory        : container directory, e.g. PbTiO3.dwtraj
+    dtype            : "float64" or "float32" for the coordinates
+    frames_per_chunk : frames per chunk file
+    compressed       : zlib-compressed .npz chunks instead of .npy
+
+    Returns:
+    the metadata of the container (see meta.json)
+    """
+    dtype = np.dtype(dtype)
+    os.makedirs(directory, exist_ok=True)
+    # A partly written container is not valid: meta.json is written last
+    if os.path.exists(os.path.join(directory, meta_file_name)):
+        os.remove(os.path.join(directory, meta_file_name))
+
+    meta = None
+    lattice_vectors, chunk_sizes, batch = [], [], []
+
+    def flush():
+        coordinates = np.stack(batch).astype(dtype, copy=False)
+        chunk_file = _chunk_file(directory, len(chunk_sizes), compressed)
+        if compressed:
+            np.savez_compressed(chunk_file, coordinates=coordinates)
+        else:
+            np.save(chunk_file, coordinates, allow_pickle=False)
+        chunk_sizes.append(len(batch))
+        batch.clear()
+
+    for frame in read_poscar_frames(poscar_file):
+        if meta is None:
+            species, atomic_numbers = species_arrays(frame["species_names"], frame["species_counts"])
+            np.save(os.path.join(directory, "species.npy"), species)
+            np.save(os.path.join(directory, "atomic_numbers.npy"), atomic_numbers)
+            meta = {"source": os.path.abspath(poscar_file),
+                    "number_of_atoms": len(frame["coordinates"]),
+                    "species_names": list(frame["species_names"]),
+                    "species_counts": list(frame["species_counts"]),
+                    "dtype": dtype.name,
+                    "compressed": compressed}
+        elif len(frame["coordinates"]) != meta["number_of_atoms"]:
+            raise ValueError(f"{poscar_file}: frame {len(lattice_vectors) + 1} has {len(frame['coordinates'])} "
+                             f"atoms, the first one {meta['number_of_atoms']}")
+
+        lattice_vectors.append(frame["lattice_vectors"] * frame["scaling_factor"])
+        batch.append(frame["coordinates"])
+        if len(batch) == frames_per_chunk:
+            flush()
+
+    if meta is None:
+        raise ValueError(f"No POSCAR frame found in {poscar_file}")
+    if batch:
+        flush()
+
+    np.save(os.path.join(directory, "lattice_vectors.npy"), np.stack(lattice_vectors))
+    meta["number_of_frames"] = len(lattice_vectors)
+    meta["chunk_sizes"] = chunk_sizes
+    with open(os.path.join(directory, meta_file_name), 'w') as meta_file:
+        json.dump(meta, meta_file, indent=1)
+    return meta
+
+
+def open_trajectory(directory):
+    """
+    Open a trajectory container. Nothing but the metadata and the small
+    per-atom arrays is read: the lattice vectors and the .npy chunks are
+    memory-mapped.
+
+    Returns:
+    dictionary with the metadata, the lattice vectors (F, 3, 3, Ang), the
+    species index and atomic number of every atom (N,), and the chunk
+    boundaries (frame index of the start of every chunk, and F)
+    """
+    meta_file = os.path.join(directory, meta_file_name)
+    if not os.path.isfile(meta_file):
+        raise FileNotFoundError(f"{directory} is not a trajectory container (no {meta_file_name})")
+    with open(meta_file, 'r') as meta_handle:
+        trajectory = json.load(meta_handle)
+
+    trajectory["directory"] = directory
+    trajectory["lattice_vectors"] = np.load(os.path.join(directory, "lattice_vectors.npy"), mmap_mode='r')
+    trajectory["species"] = np.load(os.path.join(directory, "species.npy"))
+    trajectory["atomic_numbers"] = np.load(os.path.join(directory, "atomic_numbers.npy"))
+    trajectory["chunk_starts"] = np.concatenate([[0], np.cumsum(trajectory["chunk_sizes"])])
+    trajectory["chunks"] = {}
+    return trajectory
+
+
+def _chunk(trajectory, chunk):
+    # Coordinates of one chunk: memory-mapped .npy, or the decompressed
+    # .npz of the last chunk read
+    if chunk not in trajectory["chunks"]:
+        chunk_file = _chunk_file(trajectory["directory"], chunk, trajectory["compressed"])
+        if trajectory["compressed"]:
+            with np.load(chunk_file) as archive:
+                trajectory["chunks"] = {chunk: archive["coordinates"]}
+        else:
+            trajectory["chunks"][chunk] = np.load(chunk_file, mmap_mode='r')
+    return trajectory["chunks"][chunk]
+
+
+def frame_blocks(trajectory, start=0, stop=None):
+    """
+    Generator over the frames start:stop, one block per chunk they span.
+    For .npy chunks the blocks are views on the memory-mapped files.
+
+    Yields:
+    index of the first frame of the block, fractional coordinates
+    (k, N, 3) and lattice vectors (k, 3, 3, Ang) of the k frames
+    """
+    number_of_frames = trajectory["number_of_frames"]
+    start, stop, _ = slice(start, stop).indices(number_of_frames)
+    chunk_starts = trajectory["chunk_starts"]
+
+    frame = start
+    while frame < stop:
+        chunk = np.searchsorted(chunk_starts, frame, side='right') - 1
+        end = min(stop, chunk_starts[chunk + 1])
+        coordinates = _chunk(trajectory, chunk)[frame - chunk_starts[chunk]:end - chunk_starts[chunk]]
+        yield frame, coordinates, trajectory["lattice_vectors"][frame:end]
+        frame = end
+
+
+@timed("load")
+def read_frames(trajectory, start=0, stop=None):
+    """
+    Fractional coordinates (k, N, 3) and lattice vectors (k, 3, 3) of the
+    frames start:stop; a view when they lie in one .npy chunk.
+    """
+    blocks = list(frame_blocks(trajectory, start, stop))
+    if not blocks:
+        return (np.empty((0, trajectory["number_of_atoms"], 3), dtype=trajectory["dtype"]),
+                np.empty((0, 3, 3)))
+    if len(blocks) == 1:
+        return blocks[0][1], blocks[0][2]
+    return np.concatenate([block[1] for block in blocks]), np.concatenate([block[2] for block in blocks])
+
+
+def trajectory_frames(trajectory, start=0, stop=None):
+    """
+    Generator over the frames start:stop as the dictionaries yielded by
+    POSCAR2XV.read_poscar_frames (the lattice vectors already scaled), so
+    that the trajectory can replace a _HIST.poscar file downstream.
+    """
+    for _, coordinates, lattice_vectors in frame_blocks(trajectory, start, stop):
+        for frame_coordinates, frame_lattice in zip(coordinates, lattice_vectors):
+            yield {"scaling_factor": 1.0,
+                   "lattice_vectors": np.asarray(frame_lattice),
+                   "species_names": trajectory["species_names"],
+                   "species_counts": trajectory["species_counts"],
+                   "coordinates": frame_coordinates}
+
+
+def export_XV(trajectory, output_file, index=-1):
+    """
+    Write one frame (default: the last one) as a text XV file, e.g. for a
+    SIESTA restart.
+    """
+    index = range(trajectory["number_of_frames"])[index]
+    frame = next(trajectory_frames(trajectory, index, index + 1))
+    frame["coordinates"] = np.asarray(frame["coordinates"], dtype=float)
+    write_to_XV(output_file, frame, (trajectory["species"], trajectory["atomic_numbers"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store a _HIST.poscar trajectory in a binary container, "
+                                                 "or export a frame of a container as an XV file.")
+    parser.add_argument("source", help="POSCAR / _HIST.poscar file, or a container with --export")
+    parser.add_argument("-o", "--output", default=None,
+                        help="container directory (default: <source>.dwtraj), or XV file with --export")
+    parser.add_argument("--float32", action="store_true", help="store the coordinates as float32")
+    parser.add_argument("--compressed", action="store_true", help="zlib-compressed chunks")
+    parser.add_argument("--chunk-frames", type=int, default=chunk_frames,
+                        help=f"frames per chunk (default: {chunk_frames})")
+    parser.add_argument("--export", type=int, nargs="?", const=-1, default=None, metavar="FRAME",
+                        help="write frame FRAME (default: the last) of the container source as an XV file")
+    args = parser.parse_args()
+
+    if args.export is not None:
+        export_XV(open_trajectory(args.source), args.output or "PbTiO3.XV", args.export)
+    else:
+        start = time.perf_counter()
+        meta = write_trajectory(args.source, args.output or args.source + ".dwtraj",
+                                "float32" if args.float32 else "float64", args.chunk_frames, args.compressed)
+        elapsed = time.perf_counter() - start
+        print(f"Stored {meta['number_of_frames']} frame(s) of {meta['number_of_atoms']} atoms "
+              f"in {len(meta['chunk_sizes'])} chunk(s) in {elapsed:.2f} s")
@@ -0,0 +1,117 @@
+"""
+Units and conversion factors shared by the DW energy scripts and
+POSCAR2XV.py.
+
+The composed factors are computed once here, so a chain such as
+eV/cell -> mJ/m^2 -> meV/square is a single multiplication. All the
+conversion functions work elementwise on floats and NumPy arrays.
+
+NumPy is only imported when a list or tuple has to be converted, so the
+scalar conversions of the energy scripts start without it.
+"""
+
+# ----------------------
+# Base constants
+# ----------------------
+eV2J = 1.6022e-19           # J per eV
+J2mJ = 1.e3                 # mJ per J
+eV2meV = 1.e3               # meV per eV
+Ang2_to_m2 = 1.e-20         # m^2 per Ang^2
+bohr_in_Ang = 0.529177      # Bohr radius in Ang
+Hartree2eV = 27.211386245988  # eV per Hartree (ABINIT energies)
+
+# ----------------------
+# Composed factors
+# ----------------------
+Ang2Bohr = 1 / bohr_in_Ang                      # Bohr per Ang
+mJ2meV = 1 / eV2J                               # meV per mJ
+
+# eV per unit cell -> mJ/m^2, for a PbO plane area given in Ang^2
+eV_per_Ang2_to_mJ_per_m2 = eV2J * J2mJ / Ang2_to_m2
+
+# mJ/m^2 -> meV per square, for a PbO plane area given in Ang^2
+mJ_per_m2_to_meV_per_Ang2 = mJ2meV * Ang2_to_m2
+
+# Polarization: e/Ang^2 -> C/m^2 (the elementary charge in C is eV2J)
+e_per_Ang2_to_C_per_m2 = eV2J / Ang2_to_m2
+
+# ----------------------
+# Reference energies
+# ----------------------
+# Energy of the relaxed bulk tetragonal ferroelectric unit cell in eV.
+# There is no ABINIT value yet: the one of mJm2_and_meVsquare_dw_energy.py
+# (-93909.02545) is not on the energy scale of the ABINIT supercell energies
+# it was paired with, so ABINIT runs must give their reference explicitly.
+energy_tetra_of_code = {"SIESTA": -8668.729994}
+
+# ----------------------
+# Reference structure
+# ----------------------
+# In-plane lattice parameter (Ang) of the relaxed bulk tetragonal
+# ferroelectric cell, the reference of the misfit strain and of epsilon_1
+a_reference = 3.870565
+
+
+def bulk_reference_energy(code, energy_tetra=None):
+    """
+    Energy of the bulk tetragonal unit cell (eV) for code: energy_tetra if
+    given, otherwise the value of energy_tetra_of_code.
+    """
+    if energy_tetra is not None:
+        return energy_tetra
+    if code not in energy_tetra_of_code:
+        raise ValueError(f"No bulk reference energy is known for {code}: give energy_tetra explicitly")
+    return energy_tetra_of_code[code]
+
+
+def _multiply(values, factor):
+    # Floats and NumPy arrays multiply as they are; lists and tuples go
+    # through NumPy
+    if isinstance(values, (list, tuple)) or isinstance(factor, (list, tuple)):
+        import numpy as np
+        return np.multiply(values, factor)
+    return values * factor
+
+
+def eV_to_meV(energy_in_eV):
+    """
+    eV -> meV.
+    """
+    return _multiply(energy_in_eV, eV2meV)
+
+
+def eV_per_uc_to_mJ_per_m2(energy_in_eV_uc, lattice_b, lattice_c):
+    """
+    DW energy in eV per unit cell -> mJ/m^2, for a PbO plane of
+    lattice_b x lattice_c (Ang).
+    """
+    return _multiply(energy_in_eV_uc, eV_per_Ang2_to_mJ_per_m2 / _multiply(lattice_b, lattice_c))
+
+
+def mJ_per_m2_to_meV_per_square(energy_in_mJ_per_m2, lattice_b, lattice_c):
+    """
+    DW energy in mJ/m^2 -> meV per square, where square is the
+    lattice_b x lattice_c (Ang) cell surface area of the DW.
+    """
+    return _multiply(energy_in_mJ_per_m2, mJ_per_m2_to_meV_per_Ang2 * _multiply(lattice_b, lattice_c))
+
+
+def Ang_to_Bohr(length_in_Ang):
+    """
+    Ang -> Bohr.
+    """
+    return _multiply(length_in_Ang, Ang2Bohr)
+
+
+def Bohr_to_Ang(length_in_Bohr):
+    """
+    Bohr -> Ang.
+    """
+    return _multiply(length_in_Bohr, bohr_in_Ang)
+
+
+def Hartree_to_eV(energy_in_Hartree):
+    """
+    Hartree -> eV.
+    """
+    return _multiply(energy_in_Hartree, Hartree2eV)